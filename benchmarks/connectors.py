@@ -0,0 +1,57 @@
+"""Benchmark of fetching a playlist from a recorded cassette, with injected latency, rate limits and server errors.
+
+The connector of the provider fetches the playlist from the local stand-in server with its real pagination, retries and
+concurrency, once per number of fetch workers. Record the cassette of the playlist once with the real music service:
+
+    HTTP_MODE=record REFRESH_PLAYLIST=true poetry run generate-hitster-cards
+    poetry run python benchmarks/connectors.py --latency-ms 100 --rate-limit 0.05
+    poetry run python benchmarks/connectors.py --fetch-workers 1 8 --error-rate 0.1 --runs 5
+"""
+
+import argparse
+import os
+import time
+
+from generator.connectors import resolve_connector
+from generator.metrics import metrics
+from generator.utils import get_env_var
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--provider", default=os.getenv("PROVIDER"), help="provider (default: PROVIDER)")
+    parser.add_argument("--playlist", default=os.getenv("PLAYLIST_ID"), help="playlist ID (default: PLAYLIST_ID)")
+    parser.add_argument("--fetch-workers", type=int, nargs="+", default=[1, 4, 8, 16], help="fetch worker counts")
+    parser.add_argument("--latency-ms", type=float, default=50, help="latency of every response (default: 50)")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="share of 429 responses (default: 0)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 responses (default: 0)")
+    parser.add_argument("--runs", type=int, default=3, help="number of runs per worker count, the best one counts")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "HTTP_MODE": "replay",
+            "HTTP_REPLAY_LATENCY_MS": str(args.latency_ms),
+            "HTTP_REPLAY_RATE_LIMIT": str(args.rate_limit),
+            "HTTP_REPLAY_ERROR_RATE": str(args.error_rate),
+        }
+    )
+    playlist_id = args.playlist or get_env_var("PLAYLIST_ID")
+
+    for fetch_workers in args.fetch_workers:
+        os.environ["FETCH_WORKERS"] = str(fetch_workers)
+        connector = resolve_connector(args.provider)
+
+        timings = []
+        for _ in range(args.runs):
+            requests_before = metrics.http[str(connector.source)]["requests"]
+            start_time = time.perf_counter()
+            songs = connector.get_playlist_songs(playlist_id)
+            timings.append(time.perf_counter() - start_time)
+            requests = metrics.http[str(connector.source)]["requests"] - requests_before
+
+        print(f"{fetch_workers:>3} fetch workers: {len(songs)} songs in {min(timings):.2f}s, {requests} requests")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Import time benchmark of the generate-hitster-cards entry point and the modules every render worker imports.
+
+Every module is imported in a fresh interpreter with `python -X importtime`, the best of several runs is compared with
+the baseline recorded in import_time.json. The benchmark fails if a module got slower than the threshold allows. The
+baseline depends on the machine, so it isn't committed.
+
+    poetry run python benchmarks/import_time.py           # compare with the baseline
+    poetry run python benchmarks/import_time.py --record  # record the current import times as new baseline
+"""
+
+import argparse
+import json
+import platform
+import subprocess
+import sys
+from pathlib import Path
+
+from generator.render.executor import WARM_UP_MODULES
+
+BASELINE_PATH = Path(__file__).with_suffix(".json")
+
+# the CLI entry point and what a render worker imports on startup
+MODULES = ("generator.main", *WARM_UP_MODULES)
+
+
+def measure_import_time(module: str) -> float:
+    """Cumulative import time of a module in milliseconds, in a fresh interpreter"""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    # lines look like "import time:       123 |       4567 | generator.main"
+    for line in result.stderr.splitlines():
+        fields = [field.strip() for field in line.removeprefix("import time:").split("|")]
+        if len(fields) == 3 and fields[2] == module:
+            return int(fields[1]) / 1000
+    raise RuntimeError(f"No import time reported for {module}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--record", action="store_true", help="record the import times as new baseline")
+    parser.add_argument("--runs", type=int, default=5, help="number of runs per module, the best one counts")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown (default: 0.25)")
+    args = parser.parse_args()
+
+    import_times = {module: min(measure_import_time(module) for _ in range(args.runs)) for module in MODULES}
+
+    if args.record:
+        baseline = {"python": platform.python_version(), "modules": import_times}
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=4) + "\n", encoding="utf-8")
+        for module, import_time in import_times.items():
+            print(f"{module}: {import_time:.1f}ms")
+        print(f"Baseline recorded to {BASELINE_PATH}")
+        return
+
+    if not BASELINE_PATH.exists():
+        sys.exit(f"No baseline at {BASELINE_PATH}, record one with --record")
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    if baseline["python"] != platform.python_version():
+        print(f"Warning: baseline was recorded with Python {baseline['python']}")
+
+    regressions = []
+    for module, import_time in import_times.items():
+        budget = baseline["modules"].get(module)
+        if budget is None:
+            print(f"{module}: {import_time:.1f}ms (no baseline)")
+            continue
+
+        change = import_time / budget - 1
+        print(f"{module}: {import_time:.1f}ms (baseline {budget:.1f}ms, {change:+.0%})")
+        if change > args.threshold:
+            regressions.append(module)
+
+    if regressions:
+        sys.exit(f"Import time regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Memory benchmark of holding, overriding and saving the songs of a large catalog.
+
+The songs of a synthetic playlist of 50k songs are created and stored in the playlist cache, loaded from it again, 1%
+of them are overridden from the override store and they are written to songs.json. The peak of the traced allocations
+is reported per step.
+
+    poetry run python benchmarks/memory.py
+    poetry run python benchmarks/memory.py --songs 200000
+"""
+
+import argparse
+import json
+import resource
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from pathlib import Path
+from typing import Any
+
+# the benchmarks directory is on the path when run as a script
+from pipeline import SyntheticConnector
+
+from generator.connectors import PlaylistCache
+from generator.main import write_songs_json
+from generator.overrides import OverrideStore
+
+
+def measure(name: str, function: Callable[[], Any]) -> Any:
+    """Run a step and print its time and the peak of the memory it allocated on top of what is already held"""
+
+    tracemalloc.reset_peak()
+    held = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start_time
+    current, peak = tracemalloc.get_traced_memory()
+    print(f"{name:<24} {elapsed:6.2f}s  peak {(peak - held) / 2**20:8.1f}MB  held {(current - held) / 2**20:8.1f}MB")
+    return result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, default=50_000, help="number of songs in the catalog (default: 50000)")
+    args = parser.parse_args()
+
+    connector = SyntheticConnector()
+    playlist_id = str(args.songs)
+    tracemalloc.start()
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = PlaylistCache(Path(directory))
+        songs = measure("create and cache songs", lambda: cache.get_playlist_songs(connector, playlist_id))
+        songs = measure("load cached songs", lambda: cache.get_playlist_songs(connector, playlist_id))
+
+        overrides_json = Path(directory) / "overrides.json"
+        overrides_json.write_text(json.dumps([{"id": song.id, "year": song.year + 1} for song in songs[::100]]))
+        with OverrideStore(Path(directory) / "overrides.db") as overrides:
+            overrides.import_json(overrides_json)
+            songs = measure("apply overrides", lambda: overrides.apply(songs))
+        measure("write songs.json", lambda: write_songs_json(songs, Path(directory) / "songs.json"))
+
+    print(f"{len(songs)} songs, {tracemalloc.get_traced_memory()[0] / len(songs):.0f} bytes per song")
+    tracemalloc.stop()
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (2**20 if sys.platform == "darwin" else 2**10)
+    print(f"peak RSS {peak_rss:.1f}MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Micro-benchmark of the song title normalization over a synthetic corpus of 100k titles.
+
+Compares applying the rules one regex call after another, as the connectors used to, with the compiled normalizer, once
+cold and once with warm memos, and checks that both produce the same titles and featured artists.
+
+    poetry run python benchmarks/normalization.py
+    poetry run python benchmarks/normalization.py --titles 1000000
+"""
+
+import argparse
+import random
+import re
+import time
+from collections.abc import Callable
+
+from generator.connectors.normalization import DEFAULT_RULES, TitleNormalizer
+
+WORDS = [
+    "love",
+    "night",
+    "heart",
+    "baby",
+    "dance",
+    "fire",
+    "rain",
+    "summer",
+    "dream",
+    "girl",
+    "boy",
+    "blue",
+    "sweet",
+    "wild",
+    "home",
+    "time",
+    "light",
+    "world",
+]
+SUFFIXES = [
+    "",
+    "",
+    "",
+    " (Remastered 2011)",
+    " - 2009 Remaster",
+    " [Radio Edit]",
+    " (Single Version)",
+    " (feat. Artist {n})",
+    " [featuring Artist {n}]",
+    " (with Artist {n})",
+    " (Live)",
+    " (Explicit)",
+    " (feat. Artist {n}) [featuring Artist {n}0]",
+    " [featuring Artist {n}] (feat. Artist {n}0)",
+]
+ARTISTS = ["Artist 1", "Artist 10"]
+
+
+def generate_titles(count: int) -> list[str]:
+    """Titles of 1-4 random words with a random suffix, many of them repeating like in real playlists"""
+
+    rng = random.Random(0)
+    return [
+        " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title() + rng.choice(SUFFIXES).format(n=rng.randint(1, 50))
+        for _ in range(count)
+    ]
+
+
+def sanitize_sequentially(title: str) -> str:
+    """Reference implementation applying every rule with its own re.sub call"""
+
+    sanitized = title.strip()
+    for pattern in DEFAULT_RULES.title_removals:
+        sanitized = re.sub(pattern, "", sanitized, flags=re.IGNORECASE)
+    return re.sub(r"\s+", " ", sanitized).strip()
+
+
+def add_featuring_artists_sequentially(title: str) -> list[str]:
+    """Reference implementation searching every featuring pattern on its own, the first one in rule order wins"""
+
+    for pattern in DEFAULT_RULES.featuring_patterns:
+        if match := re.search(pattern, title, re.IGNORECASE):
+            featuring_artist = match.group(1).strip()
+            if featuring_artist.lower() not in [artist.lower() for artist in ARTISTS]:
+                return [*ARTISTS, featuring_artist]
+            break
+    return ARTISTS
+
+
+def measure(name: str, function: Callable[[str], object], titles: list[str]) -> list:
+    start_time = time.perf_counter()
+    results = [function(title) for title in titles]
+    elapsed = time.perf_counter() - start_time
+    print(f"{name:<24} {elapsed * 1000:8.1f}ms {elapsed / len(titles) * 1e9:8.0f}ns/title")
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--titles", type=int, default=100_000, help="number of titles in the corpus (default: 100000)")
+    args = parser.parse_args()
+
+    titles = generate_titles(args.titles)
+    print(f"{len(titles)} titles, {len(set(titles))} unique")
+
+    normalizer = TitleNormalizer(DEFAULT_RULES)
+    mismatches = []
+    for name, reference, compiled in [
+        ("titles", sanitize_sequentially, normalizer.sanitize_title),
+        (
+            "featuring",
+            add_featuring_artists_sequentially,
+            lambda title: normalizer.add_featuring_artists(title, ARTISTS),
+        ),
+    ]:
+        expected = measure(f"{name}, sequential", reference, titles)
+        cold = measure(f"{name}, compiled, cold", compiled, titles)
+        warm = measure(f"{name}, compiled, warm", compiled, titles)
+        mismatch_count = sum(
+            result != expected_result
+            for results in (cold, warm)
+            for result, expected_result in zip(results, expected, strict=True)
+        )
+        if mismatch_count:
+            mismatches.append(f"{mismatch_count} {name}")
+
+    if mismatches:
+        raise SystemExit(f"Results differ from the sequential reference: {', '.join(mismatches)}")
+
+
+if __name__ == "__main__":
+    main()
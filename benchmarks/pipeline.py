@@ -0,0 +1,218 @@
+"""Benchmark of the render stages over synthetic playlists, per theme and worker count, fully offline.
+
+A fake connector generates deterministic playlists of 100, 1k and 10k songs. Every stage runs on its own with an empty
+asset cache and without build manifest, so every run renders everything. The best of several runs is compared with the
+baseline recorded in pipeline.json, the benchmark fails if a stage got slower than the threshold allows.
+
+    poetry run python benchmarks/pipeline.py                                # compare with the baseline
+    poetry run python benchmarks/pipeline.py --record                       # record a new baseline
+    poetry run python benchmarks/pipeline.py --songs 1000 --themes colored  # a single configuration
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+
+from generator.connectors import Connector, Song
+from generator.connectors.interfaces import Source
+from generator.render import generate_cards_pdf, generate_qr_codes, generate_year_distribution
+from generator.render.executor import RenderExecutor
+from generator.render.images import generate_decoration_images
+from generator.themes import Theme
+from generator.utils import get_max_workers
+
+BASELINE_PATH = Path(__file__).with_suffix(".json")
+OUTPUT_DIR = Path("generated/benchmark")
+
+SONG_COUNTS = (100, 1_000, 10_000)
+STAGES = ("qr-codes", "decoration-images", "cards-pdf", "year-distribution")
+
+# differences below are measurement noise, even if they exceed the relative threshold
+NOISE_FLOOR = 0.05
+
+WORDS = [
+    "love",
+    "night",
+    "heart",
+    "baby",
+    "dance",
+    "fire",
+    "rain",
+    "summer",
+    "dream",
+    "girl",
+    "boy",
+    "blue",
+    "sweet",
+    "wild",
+    "home",
+    "time",
+    "light",
+    "world",
+]
+SUFFIXES = ["", "", "", " (Remastered 2011)", " [Radio Edit]", " (feat. Artist {n})", " (Live)"]
+
+
+class SyntheticConnector(Connector):
+    """Connector generating the same playlist for the same ID, without any network access
+
+    The playlist ID is the number of songs, e.g. "1000".
+    """
+
+    source = Source.SPOTIFY
+    PAGE_SIZE = 100
+
+    def iter_playlist_songs(self, playlist_id: str) -> Iterator[list[Song]]:
+        rng = random.Random(playlist_id)
+        artists = [f"Artist {n}" for n in range(1, max(2, int(playlist_id) // 4))]
+
+        page = []
+        for _ in range(int(playlist_id)):
+            song_id = "".join(rng.choices(string.ascii_letters + string.digits, k=22))
+            title = " ".join(rng.choices(WORDS, k=rng.randint(1, 4))).title()
+            title += rng.choice(SUFFIXES).format(n=rng.randint(1, 50))
+            page.append(
+                Song(
+                    id=song_id,
+                    title=self.sanitize_song_title(title),
+                    artists=self.add_featuring_artists(title, [rng.choice(artists)]),
+                    # more recent years are more common, like in most playlists
+                    year=int(rng.triangular(1950, 2025, 2010)),
+                    url=f"https://open.spotify.com/track/{song_id}",
+                    source=self.source,
+                )
+            )
+            if len(page) == self.PAGE_SIZE:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    def get_playlist_version(self, playlist_id: str) -> str | None:
+        # the playlist of an ID never changes
+        return playlist_id
+
+
+def measure(function: Callable[[], object], cache_dir: Path) -> float:
+    """Run a stage with an empty asset cache and return its wall time in seconds"""
+
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    start_time = time.perf_counter()
+    function()
+    return time.perf_counter() - start_time
+
+
+def run_configuration(songs: list[Song], theme: Theme, workers: int, runs: int, cache_dir: Path) -> dict[str, float]:
+    """Best wall time of every stage in seconds"""
+
+    output_dir = OUTPUT_DIR / f"{len(songs)}-{theme}-{workers}"
+    qr_codes_dir = output_dir / "qr-codes"
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    with RenderExecutor(max_workers=workers) as executor:
+        # start the worker processes before the first stage is timed, max(0, 1) is a cheap picklable task
+        list(executor.map(max, 0, [(1,)] * workers, prefix="Warm-up"))
+
+        stages = {
+            "qr-codes": lambda: generate_qr_codes(theme, songs, executor=executor, output_dir=qr_codes_dir),
+            "decoration-images": lambda: generate_decoration_images(theme, executor=executor),
+            "cards-pdf": lambda: generate_cards_pdf(
+                theme, str(output_dir / "hitster.pdf"), songs, executor=executor, qr_codes_dir=qr_codes_dir
+            ),
+            "year-distribution": lambda: generate_year_distribution(songs, str(output_dir / "year-distribution.pdf")),
+        }
+        # the cards PDF needs the QR codes and images of the previous stages, so they run in order on every run
+        timings = [{name: measure(stage, cache_dir) for name, stage in stages.items()} for _ in range(runs)]
+
+    return {name: min(timing[name] for timing in timings) for name in STAGES}
+
+
+def print_scaling(results: dict[str, dict[str, float]], song_counts: list[int]) -> None:
+    """Print the time per song of every stage over the playlist sizes, to spot stages that don't scale linearly"""
+
+    configurations = sorted({key.split("/", 1)[1] for key in results})
+    print(f"\n{'ms per song':<40}" + "".join(f"{count:>10}" for count in song_counts))
+    for configuration in configurations:
+        for stage in STAGES:
+            row = [results.get(f"{count}/{configuration}", {}).get(stage) for count in song_counts]
+            cells = "".join(
+                f"{'-':>10}" if seconds is None else f"{seconds / count * 1000:10.3f}"
+                for seconds, count in zip(row, song_counts, strict=True)
+            )
+            print(f"{configuration + ' ' + stage:<40}{cells}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--songs", type=int, nargs="+", default=list(SONG_COUNTS), help="playlist sizes")
+    parser.add_argument("--themes", nargs="+", type=Theme, default=list(Theme), help="themes (default: all)")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=sorted({1, get_max_workers()}),
+        help="worker counts (default: 1 and the number of CPUs)",
+    )
+    parser.add_argument("--runs", type=int, default=3, help="number of runs per configuration, the best one counts")
+    parser.add_argument("--record", action="store_true", help="record the timings as new baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative slowdown (default: 0.25)")
+    args = parser.parse_args()
+
+    # an empty asset cache for every run, without touching the one of real builds
+    cache_dir = Path(tempfile.mkdtemp(prefix="hitster-benchmark-"))
+    os.environ["HITSTER_CACHE_DIR"] = str(cache_dir)
+
+    results: dict[str, dict[str, float]] = {}
+    try:
+        for song_count in args.songs:
+            songs = sorted(SyntheticConnector().get_playlist_songs(str(song_count)), key=lambda song: song.year)
+            for theme in args.themes:
+                for workers in args.workers:
+                    key = f"{song_count}/{theme}/{workers}"
+                    results[key] = run_configuration(songs, theme, workers, args.runs, cache_dir)
+                    print(f"{key}: " + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in results[key].items()))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        shutil.rmtree(OUTPUT_DIR, ignore_errors=True)
+
+    print_scaling(results, args.songs)
+
+    if args.record:
+        baseline = {"python": platform.python_version(), "cpus": os.cpu_count(), "configurations": results}
+        BASELINE_PATH.write_text(json.dumps(baseline, indent=4) + "\n", encoding="utf-8")
+        print(f"\nBaseline recorded to {BASELINE_PATH}")
+        return
+
+    if not BASELINE_PATH.exists():
+        sys.exit(f"No baseline at {BASELINE_PATH}, record one with --record")
+
+    baseline = json.loads(BASELINE_PATH.read_text(encoding="utf-8"))
+    if baseline["python"] != platform.python_version() or baseline["cpus"] != os.cpu_count():
+        print(f"\nWarning: baseline was recorded with Python {baseline['python']} on {baseline['cpus']} CPUs")
+
+    regressions = []
+    for key, timings in results.items():
+        for stage, seconds in timings.items():
+            budget = baseline["configurations"].get(key, {}).get(stage)
+            if budget is None:
+                continue
+            if seconds > budget * (1 + args.threshold) and seconds - budget > NOISE_FLOOR:
+                print(f"{key} {stage}: {seconds:.2f}s (baseline {budget:.2f}s, {seconds / budget - 1:+.0%})")
+                regressions.append(f"{key} {stage}")
+
+    if regressions:
+        sys.exit(f"Stages regressed by more than {args.threshold:.0%}: {', '.join(regressions)}")
+    print(f"\nNo stage regressed by more than {args.threshold:.0%}")
+
+
+if __name__ == "__main__":
+    main()
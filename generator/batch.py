@@ -0,0 +1,69 @@
+"""Decks built by a run, a single one configured by the environment or many from a batch file."""
+
+import json
+import os
+from dataclasses import dataclass
+from pathlib import Path
+
+from generator.themes import Theme
+from generator.utils import get_env_var
+
+GENERATED_DIR = Path("generated")
+DECKS_DIR = GENERATED_DIR / "decks"
+
+
+@dataclass(frozen=True)
+class Deck:
+    """A deck of cards built from a playlist, with its own output directory"""
+
+    name: str
+    playlist_id: str
+    provider: str
+    theme: Theme
+    output_dir: Path
+
+    @property
+    def qr_codes_dir(self) -> Path:
+        return self.output_dir / "qr-codes"
+
+
+def get_decks() -> list[Deck]:
+    """Get the decks listed in the BATCH_FILE, or the single deck of PLAYLIST_ID if no batch file is set
+
+    The batch file is a JSON list of objects with a unique name, a playlist_id and optionally a theme and a provider,
+    which default to the THEME and PROVIDER environment variables. Every deck is built into generated/decks/<name>.
+    """
+
+    default_theme = Theme(get_env_var("THEME", Theme.BLACK_WHITE))
+
+    batch_file = os.getenv("BATCH_FILE")
+    if not batch_file:
+        return [
+            Deck(
+                name="hitster",
+                playlist_id=get_env_var("PLAYLIST_ID"),
+                provider=get_env_var("PROVIDER"),
+                theme=default_theme,
+                output_dir=GENERATED_DIR,
+            )
+        ]
+
+    with Path(batch_file).open("r", encoding="utf-8") as file:
+        entries = json.load(file)
+
+    decks = [
+        Deck(
+            name=entry["name"],
+            playlist_id=entry["playlist_id"],
+            provider=entry.get("provider") or get_env_var("PROVIDER"),
+            theme=Theme(entry.get("theme", default_theme)),
+            output_dir=DECKS_DIR / entry["name"],
+        )
+        for entry in entries
+    ]
+
+    names = [deck.name for deck in decks]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise ValueError(f"Deck names in {batch_file} must be unique, found duplicates: {', '.join(duplicates)}")
+    return decks
@@ -0,0 +1,85 @@
+"""Persistent user level caches shared across runs, themes and checkouts."""
+
+import os
+import tempfile
+from pathlib import Path
+
+from generator.manifest import hash_inputs
+from generator.utils import get_env_var
+
+
+def get_cache_dir() -> Path:
+    """Get the cache directory, HITSTER_CACHE_DIR or hitster in the XDG cache home"""
+
+    if cache_dir := os.getenv("HITSTER_CACHE_DIR"):
+        return Path(cache_dir)
+
+    xdg_cache_home = os.getenv("XDG_CACHE_HOME")
+    return (Path(xdg_cache_home) if xdg_cache_home else Path.home() / ".cache") / "hitster"
+
+
+class AssetCache:
+    """Content addressed file cache with a size limit, evicting the least recently used entries
+
+    Entries are written atomically, so the cache can be shared by concurrent worker processes.
+    """
+
+    def __init__(self, name: str, max_size_mb: int | None = None, suffix: str = ""):
+        self.directory = get_cache_dir() / name
+        self.max_size = (max_size_mb or int(get_env_var("ASSET_CACHE_MAX_MB", "256"))) * 1024 * 1024
+        self.suffix = suffix
+
+    @staticmethod
+    def key(*parts: object) -> str:
+        """Build a cache key from the inputs that determine the content of an entry"""
+        return hash_inputs(*parts)
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}{self.suffix}"
+
+    def get(self, key: str) -> Path | None:
+        """Get the path of a cached entry and mark it as recently used"""
+
+        path = self._path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, data: bytes) -> Path:
+        """Store an entry and return its path"""
+
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.NamedTemporaryFile(dir=path.parent, delete=False) as file:
+            file.write(data)
+        Path(file.name).replace(path)
+
+        return path
+
+    def evict(self) -> int:
+        """Remove the least recently used entries until the cache fits its size limit, returns the removed count"""
+
+        if not self.directory.exists():
+            return 0
+
+        entries = []
+        for path in self.directory.glob(f"*/*{self.suffix}"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total_size = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            path.unlink(missing_ok=True)
+            total_size -= size
+            removed += 1
+
+        return removed
@@ -1,23 +1,30 @@
-from generator.connectors.apple_music import AppleMusicConnector
-from generator.connectors.interfaces import Connector, Song
-from generator.connectors.spotify import SpotifyConnector
+from generator.connectors.cache import PlaylistCache
+from generator.connectors.interfaces import Connector, Song, iter_songs_json
 from generator.logger import info
 from generator.utils import get_env_var
 
 
-def resolve_connector() -> Connector:
-    """Resolve the connector based on the provider environment variable"""
+def resolve_connector(provider: str | None = None) -> Connector:
+    """Resolve the connector of the given provider, or of the provider environment variable
 
-    provider = get_env_var("PROVIDER")
+    The connectors are imported here, so only the client library of the used music service is loaded. Modules that just
+    need the Song model, like the render workers, don't load any of them.
+    """
+
+    provider = provider or get_env_var("PROVIDER")
     match provider:
         case "spotify":
+            from generator.connectors.spotify import SpotifyConnector  # noqa: PLC0415
+
             info("Using [highlight]Spotify[/highlight] connector")
             return SpotifyConnector()
         case "apple-music":
+            from generator.connectors.apple_music import AppleMusicConnector  # noqa: PLC0415
+
             info("Using [highlight]Apple Music[/highlight] connector")
             return AppleMusicConnector()
         case _:
             raise ValueError(f"Invalid provider: {provider}")
 
 
-__all__ = ["Connector", "Song", "resolve_connector"]
+__all__ = ["Connector", "PlaylistCache", "Song", "iter_songs_json", "resolve_connector"]
@@ -1,88 +1,133 @@
+import os
+import threading
 import time
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from urllib.parse import urlsplit
 
 import jwt
 import requests
 
+from generator.connectors.http import create_session, request_with_retries
 from generator.connectors.interfaces import Connector, Song, Source
-from generator.logger import error, skip
-from generator.utils import get_env_var
+from generator.logger import skip
+from generator.utils import get_env_var, get_fetch_workers
 
 
 class AppleMusicConnector(Connector):
     """Apple Music API connector"""
 
+    source = Source.APPLE_MUSIC
+
     _BASE_URL = "https://api.music.apple.com"
+    _PAGE_SIZE = 100
+
+    _TOKEN_LIFETIME = 600  # 10 minutes
+    _TOKEN_REFRESH_MARGIN = 60  # refresh the token this many seconds before it expires
 
     def __init__(self):
         self._TEAM_ID = get_env_var("APPLE_TEAM_ID")
         self._KEY_ID = get_env_var("APPLE_KEY_ID")
         self._PRIVATE_KEY_PATH = get_env_var("APPLE_PRIVATE_KEY_PATH")
 
-        self._token = self._generate_token()
+        # Overridable to run against a local stand-in server
+        self._base_url = get_env_var("APPLE_MUSIC_API_BASE_URL", self._BASE_URL).rstrip("/")
+
+        # User token is optional for public playlists
+        self._user_token = os.getenv("APPLE_MUSIC_USER_TOKEN") or None
+
+        with Path(self._PRIVATE_KEY_PATH).open("r", encoding="utf-8") as key_file:
+            self._private_key = key_file.read()
+
+        self._fetch_workers = get_fetch_workers()
+        self._session = create_session(self._fetch_workers, name=str(self.source))
+
+        self._token_lock = threading.Lock()
+        self._token_expires_at = 0.0
+        self._headers: dict[str, str] = {}
+
+    def iter_playlist_songs(self, playlist_id: str) -> Iterator[list[Song]]:
+        """Yield songs from an Apple Music playlist page by page"""
 
-    def get_playlist_songs(self, playlist_id: str) -> list[Song]:
-        """Get songs from an Apple Music playlist"""
+        for page in self._iter_playlist_pages(playlist_id):
+            songs: list[Song] = []
+            for item in page.get("data", []):
+                if item["type"] == "songs":
+                    song = self._parse_song(item)
+                    if song:
+                        songs.append(song)
+            yield songs
 
-        songs: list[Song] = []
+    def get_playlist_version(self, playlist_id: str) -> str | None:
+        """The last modification date of the playlist"""
+
+        data = self._make_request(f"/v1/catalog/us/playlists/{playlist_id}")
+        playlists = data.get("data", [])
+        if not playlists:
+            return None
+        return playlists[0].get("attributes", {}).get("lastModifiedDate")
+
+    def _iter_playlist_pages(self, playlist_id: str) -> Iterator[dict]:
+        """Fetch all track pages of a playlist in order, the pages after the first one concurrently by offset"""
 
         endpoint = f"/v1/catalog/us/playlists/{playlist_id}/tracks"
-        params = {
-            "limit": 100,
-            "include": "albums",
-        }
 
-        while True:
-            try:
-                data = self._make_request(endpoint, params)
-
-                for item in data.get("data", []):
-                    if item["type"] == "songs":
-                        track = item["attributes"]
-
-                        name = track.get("name", None)
-                        if not name:
-                            skip(f"Song {track.get('id', 'Unknown')}", "no name")
-                            continue
-
-                        artists = track.get("artistName", None)
-                        if not artists:
-                            skip(f"'{name}'", "no artist")
-                            continue
-
-                        year = self._resolve_year(track.get("releaseDate", ""))
-                        if int(year) <= 0:
-                            skip(f"'{name}'", "no release year")
-                            continue
-
-                        preview_url = track.get("previews", [{}])[0].get("url") if track.get("previews") else None
-                        if not preview_url:
-                            skip(f"'{name}'", "no preview URL")
-                            continue
-
-                        songs.append(
-                            Song(
-                                id=item["id"],
-                                title=self.sanitize_song_title(name),
-                                artists=self.add_featuring_artists(name, [artists]),
-                                year=year,
-                                url=preview_url,
-                                source=Source.APPLE_MUSIC,
-                            )
-                        )
-
-                # Check for next page
-                if data.get("next"):
-                    endpoint = data["next"].replace(self._BASE_URL, "")
-                    params = None  # Next URL already contains params
-                else:
-                    break
-
-            except requests.exceptions.RequestException as e:
-                error(f"Error fetching Apple Music playlist: {e}")
-                break
-
-        return songs
+        first_page = self._make_request(endpoint, {"limit": self._PAGE_SIZE})
+        yield first_page
+
+        total = first_page.get("meta", {}).get("total")
+        if total is None:
+            # Without a total count the pages can only be walked sequentially
+            next_path = first_page.get("next")
+            while next_path:
+                # the link may be absolute, only its path and query are requested from the configured base URL
+                next_url = urlsplit(next_path)
+                page = self._make_request(f"{next_url.path}?{next_url.query}" if next_url.query else next_url.path)
+                yield page
+                next_path = page.get("next")
+            return
+
+        offsets = range(self._PAGE_SIZE, total, self._PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=self._fetch_workers) as executor:
+            yield from executor.map(
+                lambda offset: self._make_request(endpoint, {"limit": self._PAGE_SIZE, "offset": offset}),
+                offsets,
+            )
+
+    def _parse_song(self, item: dict) -> Song | None:
+        """Convert a song resource of the API to a song, None if required data is missing"""
+
+        track = item["attributes"]
+
+        name = track.get("name", None)
+        if not name:
+            skip(f"Song {track.get('id', 'Unknown')}", "no name")
+            return None
+
+        artists = track.get("artistName", None)
+        if not artists:
+            skip(f"'{name}'", "no artist")
+            return None
+
+        year = self._resolve_year(track.get("releaseDate", ""))
+        if int(year) <= 0:
+            skip(f"'{name}'", "no release year")
+            return None
+
+        preview_url = track.get("previews", [{}])[0].get("url") if track.get("previews") else None
+        if not preview_url:
+            skip(f"'{name}'", "no preview URL")
+            return None
+
+        return Song(
+            id=item["id"],
+            title=self.sanitize_song_title(name),
+            artists=self.add_featuring_artists(name, [artists]),
+            year=year,
+            url=preview_url,
+            source=Source.APPLE_MUSIC,
+        )
 
     def _resolve_year(self, date: str) -> int:
         """Extract year from Apple Music date string (YYYY-MM-DD format)"""
@@ -94,36 +139,48 @@ class AppleMusicConnector(Connector):
         except (IndexError, ValueError):
             return 0
 
-    def _generate_token(self) -> str:
-        """Generate JWT token for Apple Music API authentication"""
-        with Path(self._PRIVATE_KEY_PATH).open("r", encoding="utf-8") as key_file:
-            private_key = key_file.read()
+    def _generate_token(self) -> tuple[str, float]:
+        """Generate JWT token for Apple Music API authentication, returns the token and its expiry time"""
 
         headers = {"alg": "ES256", "kid": self._KEY_ID}
 
+        issued_at = int(time.time())
+        expires_at = issued_at + self._TOKEN_LIFETIME
         payload = {
             "iss": self._TEAM_ID,
-            "iat": int(time.time()),
-            "exp": int(time.time()) + 600,  # 10 minutes
+            "iat": issued_at,
+            "exp": expires_at,
         }
 
-        token = jwt.encode(payload, private_key, algorithm="ES256", headers=headers)
-        return token
+        token = jwt.encode(payload, self._private_key, algorithm="ES256", headers=headers)
+        return token, expires_at
+
+    def _get_headers(self, force_refresh: bool = False) -> dict[str, str]:
+        """Get the request headers, refreshing the developer token shortly before it expires"""
+
+        with self._token_lock:
+            if force_refresh or time.time() >= self._token_expires_at - self._TOKEN_REFRESH_MARGIN:
+                token, self._token_expires_at = self._generate_token()
+                self._headers = {"Authorization": f"Bearer {token}"}
+                if self._user_token:
+                    # For personal playlists
+                    self._headers["Music-User-Token"] = self._user_token
+            return self._headers
 
     def _make_request(self, endpoint: str, params: dict | None = None) -> dict:
-        """Make authenticated request to Apple Music API"""
-        headers = {
-            "Authorization": f"Bearer {self._token}",
-        }
+        """Make authenticated request to Apple Music API, retrying rate limited and failed requests"""
+
+        url = f"{self._base_url}{endpoint}"
 
-        # Add user token if available (for personal playlists)
         try:
-            user_token = get_env_var("APPLE_MUSIC_USER_TOKEN")
-            headers["Music-User-Token"] = user_token
-        except OSError:
-            # User token is optional for public playlists
-            pass
-
-        response = requests.get(f"{self._BASE_URL}{endpoint}", headers=headers, params=params, timeout=30)
-        response.raise_for_status()
+            response = request_with_retries(
+                self._session, "GET", url, headers=self._get_headers(), params=params, timeout=30
+            )
+        except requests.exceptions.HTTPError as e:
+            if e.response is None or e.response.status_code != 401:
+                raise
+            # The token may have been rejected before its nominal expiry, retry once with a fresh one
+            response = request_with_retries(
+                self._session, "GET", url, headers=self._get_headers(force_refresh=True), params=params, timeout=30
+            )
         return response.json()
@@ -0,0 +1,75 @@
+"""On-disk cache of normalized playlist songs, revalidated with the cheap playlist version of the music service."""
+
+import json
+import tempfile
+from collections.abc import Iterator
+from pathlib import Path
+
+from generator.cache import get_cache_dir
+from generator.connectors.interfaces import Connector, Song, iter_songs_json
+from generator.logger import info
+
+# bump when the song normalization changes to invalidate cached playlists
+PLAYLIST_CACHE_VERSION = 1
+
+
+class PlaylistCache:
+    """Songs of previously fetched playlists, refetched only when the playlist version changed"""
+
+    def __init__(self, directory: Path | None = None):
+        self.directory = directory or get_cache_dir() / "playlists"
+
+    def _path(self, connector: Connector, playlist_id: str) -> Path:
+        return self.directory / f"{connector.source}-{playlist_id}.json"
+
+    def _load(self, path: Path, version: str) -> list[Song] | None:
+        try:
+            with path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return None
+
+        if data.get("cache_version") != PLAYLIST_CACHE_VERSION or data.get("version") != version:
+            return None
+        return [Song.from_dict(song) for song in data["songs"]]
+
+    def _store(self, path: Path, version: str, songs: list[Song]) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+        # written song by song, the songs are the last field
+        header = json.dumps({"cache_version": PLAYLIST_CACHE_VERSION, "version": version}, ensure_ascii=False)
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=path.parent, delete=False) as file:
+            file.write(f'{header[:-1]}, "songs": ')
+            file.writelines(iter_songs_json(songs))
+            file.write("}")
+        Path(file.name).replace(path)
+
+    def iter_playlist_songs(
+        self,
+        connector: Connector,
+        playlist_id: str,
+        refresh: bool = False,
+    ) -> Iterator[list[Song]]:
+        """Yield the songs of a playlist from the cache if it is unchanged, otherwise stream and cache them"""
+
+        version = connector.get_playlist_version(playlist_id)
+        path = self._path(connector, playlist_id)
+
+        if version and not refresh:
+            songs = self._load(path, version)
+            if songs is not None:
+                info("Playlist unchanged since the last fetch, using cached songs")
+                yield songs
+                return
+
+        songs = []
+        for page in connector.iter_playlist_songs(playlist_id):
+            songs.extend(page)
+            yield page
+
+        if version:
+            self._store(path, version, songs)
+
+    def get_playlist_songs(self, connector: Connector, playlist_id: str, refresh: bool = False) -> list[Song]:
+        """Get the songs of a playlist from the cache if it is unchanged, otherwise fetch and cache them"""
+        return [song for page in self.iter_playlist_songs(connector, playlist_id, refresh) for song in page]
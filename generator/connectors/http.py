@@ -0,0 +1,98 @@
+"""HTTP helpers shared by the connectors: pooled sessions and retries with backoff."""
+
+import os
+import random
+import time
+from email.utils import parsedate_to_datetime
+
+import requests
+import requests.adapters
+from urllib3.util import Retry
+
+from generator.metrics import metrics
+
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# separate generator, the global one is seeded for deterministic builds
+_jitter = random.Random()
+
+
+def is_live_http() -> bool:
+    """Whether requests go to the real services, i.e. HTTP_MODE is neither record nor replay"""
+    return os.getenv("HTTP_MODE", "live") == "live"
+
+
+def create_session(pool_size: int, retry: Retry | None = None, name: str = "http") -> requests.Session:
+    """Create a session whose connection pool fits the given number of concurrent requests
+
+    The responses are counted in the build metrics under the given name. With HTTP_MODE record or replay, the name is
+    also the one of the cassette the responses are recorded to or replayed from.
+    """
+
+    session = requests.Session()
+    session.hooks["response"].append(lambda response, *_, **__: metrics.record_http(name, len(response.content)))
+
+    adapter_args = {"pool_connections": 1, "pool_maxsize": pool_size, "max_retries": retry or 0}
+    if is_live_http():
+        adapter = requests.adapters.HTTPAdapter(**adapter_args)
+    else:
+        # only loaded for offline testing, a normal build doesn't need the stand-in server
+        from generator.connectors.replay import HTTPMode, create_adapter  # noqa: PLC0415
+
+        adapter = create_adapter(name, HTTPMode(os.environ["HTTP_MODE"]), **adapter_args)
+
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _retry_after(response: requests.Response) -> float | None:
+    """Seconds to wait according to the Retry-After header, which is either a number of seconds or an HTTP date"""
+
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def request_with_retries(
+    session: requests.Session,
+    method: str,
+    url: str,
+    max_retries: int = 5,
+    backoff: float = 0.5,
+    max_backoff: float = 60.0,
+    **kwargs,
+) -> requests.Response:
+    """Send a request, retrying rate limited (429), server error (5xx) and connection failures
+
+    Retries wait exponentially longer, or as long as the Retry-After header asks for. Once the retries are exhausted
+    the last error is raised.
+    """
+
+    for attempt in range(max_retries + 1):
+        delay = backoff * 2**attempt
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt == max_retries:
+                raise
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == max_retries:
+                response.raise_for_status()
+                return response
+            if (retry_after := _retry_after(response)) is not None:
+                delay = retry_after
+
+        time.sleep(min(delay, max_backoff) * (1 + _jitter.uniform(0, 0.1)))
+
+    raise AssertionError("unreachable")
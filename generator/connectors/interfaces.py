@@ -1,9 +1,10 @@
-import re
+import json
 from abc import ABC, abstractmethod
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass, fields, replace
 from enum import StrEnum
 
-from pydantic import BaseModel
-
+from generator.connectors.normalization import DEFAULT_RULES, NormalizationRules, get_normalizer
 from generator.utils import get_env_var
 
 
@@ -12,7 +13,13 @@ class Source(StrEnum):
     APPLE_MUSIC = "apple-music"
 
 
-class Song(BaseModel):
+@dataclass(slots=True)
+class Song:
+    """Compact record of a song, large catalogs hold tens of thousands of them
+
+    The fields aren't validated, the connectors construct songs from the API responses they already checked.
+    """
+
     id: str
     title: str
     artists: list[str]
@@ -20,6 +27,24 @@ class Song(BaseModel):
     url: str
     source: Source
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "Song":
+        return cls(**{**data, "source": Source(data["source"])})
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "title": self.title,
+            "artists": self.artists,
+            "year": self.year,
+            "url": self.url,
+            "source": self.source,
+        }
+
+    def with_overrides(self, overrides: dict) -> "Song":
+        """Copy of the song with the given fields replaced, keys that aren't fields of a song are ignored"""
+        return replace(self, **{key: value for key, value in overrides.items() if key in SONG_FIELDS})
+
     @property
     def qr_code_value(self) -> str:
         if self.source == Source.APPLE_MUSIC:
@@ -28,68 +53,40 @@ class Song(BaseModel):
         return self.url
 
 
+SONG_FIELDS = frozenset(field.name for field in fields(Song))
+
+
+def iter_songs_json(songs: Iterable[Song]) -> Iterator[str]:
+    """Chunks of a compact JSON array of the songs, one song per line, so the whole document is never held in memory"""
+
+    separator = "["
+    for song in songs:
+        yield f"{separator}\n{json.dumps(song.to_dict(), ensure_ascii=False)}"
+        separator = ","
+    yield "[]\n" if separator == "[" else "\n]\n"
+
+
 class Connector(ABC):
+    source: Source
+    # connectors can extend the default rules with provider specific title suffixes
+    normalization_rules: NormalizationRules = DEFAULT_RULES
+
     @abstractmethod
+    def iter_playlist_songs(self, playlist_id: str) -> Iterator[list[Song]]:
+        """Yield the songs of a playlist page by page in playlist order, as soon as each page is available"""
+
     def get_playlist_songs(self, playlist_id: str) -> list[Song]:
-        pass
+        """Get all songs of a playlist"""
+        return [song for page in self.iter_playlist_songs(playlist_id) for song in page]
+
+    def get_playlist_version(self, playlist_id: str) -> str | None:  # noqa: ARG002
+        """Cheap identifier of the current playlist state and the connector settings, None if unsupported"""
+        return None
 
     def sanitize_song_title(self, title: str) -> str:
         """Remove common song title suffixes like (Remastered), [Radio Edit], etc."""
-
-        # Common suffixes to remove (case insensitive)
-        suffixes_to_remove = [
-            r"\(.*?remaster.*?\)",
-            r"\[.*?remaster.*?\]",
-            r"\(radio edit\)",
-            r"\[radio edit\]",
-            r"\(single version\)",
-            r"\[single version\]",
-            r"\(album version\)",
-            r"\[album version\]",
-            r"\(extended version\)",
-            r"\[extended version\]",
-            r"\(clean version\)",
-            r"\[clean version\]",
-            r"\(explicit\)",
-            r"\[explicit\]",
-            r"\(feat\. .*?\)",
-            r"\[feat\. .*?\]",
-            r"\(featuring .*?\)",
-            r"\[featuring .*?\]",
-            r"\(ft\. .*?\)",
-            r"\[ft\. .*?\]",
-            r"\(with .*?\)",
-            r"\[with .*?\]",
-            r"\(full version\)",
-            r"\[full version\]",
-        ]
-
-        sanitized = title.strip()
-
-        for pattern in suffixes_to_remove:
-            sanitized = re.sub(pattern, "", sanitized, flags=re.IGNORECASE)
-
-        return re.sub(r"\s+", " ", sanitized).strip()
+        return get_normalizer(self.normalization_rules).sanitize_title(title)
 
     def add_featuring_artists(self, title: str, artists: list[str]) -> list[str]:
         """Add featuring artists to the song name"""
-
-        patterns = [
-            r"\(feat\. (.+?)\)",
-            r"\[feat\. (.+?)\]",
-            r"\(featuring (.+?)\)",
-            r"\[featuring (.+?)\]",
-        ]
-
-        featuring_artist: str | None = None
-
-        for pattern in patterns:
-            match = re.search(pattern, title, re.IGNORECASE)
-            if match:
-                featuring_artist = match.group(1).strip()
-                break
-
-        if featuring_artist and featuring_artist.lower() not in [artist.lower() for artist in artists]:
-            return [*artists, featuring_artist]
-
-        return artists
+        return get_normalizer(self.normalization_rules).add_featuring_artists(title, artists)
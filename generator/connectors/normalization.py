@@ -0,0 +1,110 @@
+"""Rule table driven normalization of song titles and artists, compiled once into combined patterns."""
+
+import re
+from dataclasses import dataclass
+from functools import cache, lru_cache
+
+# titles and artists repeat a lot across playlists and re-releases
+MEMO_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+@dataclass(frozen=True)
+class NormalizationRules:
+    """Patterns (case insensitive) of the title parts to remove and of the featured artist in a title
+
+    Every featuring pattern has a single group that captures the featured artist.
+    """
+
+    title_removals: tuple[str, ...]
+    featuring_patterns: tuple[str, ...]
+
+    def extend(
+        self,
+        title_removals: tuple[str, ...] = (),
+        featuring_patterns: tuple[str, ...] = (),
+    ) -> "NormalizationRules":
+        """Rules with additional patterns, e.g. for provider specific title suffixes"""
+        return NormalizationRules(
+            title_removals=self.title_removals + title_removals,
+            featuring_patterns=self.featuring_patterns + featuring_patterns,
+        )
+
+
+def _bracketed(*patterns: str) -> tuple[str, ...]:
+    """The patterns enclosed in round and in square brackets"""
+    return tuple(pattern for inner in patterns for pattern in (rf"\({inner}\)", rf"\[{inner}\]"))
+
+
+DEFAULT_RULES = NormalizationRules(
+    title_removals=_bracketed(
+        r".*?remaster.*?",
+        r"radio edit",
+        r"single version",
+        r"album version",
+        r"extended version",
+        r"clean version",
+        r"explicit",
+        r"feat\. .*?",
+        r"featuring .*?",
+        r"ft\. .*?",
+        r"with .*?",
+        r"full version",
+    ),
+    featuring_patterns=_bracketed(r"feat\. (.+?)", r"featuring (.+?)"),
+)
+
+
+def _combine(patterns: tuple[str, ...]) -> re.Pattern[str]:
+    # alternatives are tried in rule order at every position, like applying the rules one after another
+    return re.compile("|".join(f"(?:{pattern})" for pattern in patterns), re.IGNORECASE)
+
+
+class TitleNormalizer:
+    """Normalizes titles and artists with the compiled rules, memoizing the results
+
+    The title removals are combined into one pattern. The featuring patterns are searched one after another, as the
+    first pattern in rule order wins, not the match that comes first in the title.
+    """
+
+    def __init__(self, rules: NormalizationRules):
+        self.rules = rules
+        self._title_removals = _combine(rules.title_removals)
+        self._featuring = tuple(re.compile(pattern, re.IGNORECASE) for pattern in rules.featuring_patterns)
+
+        self.sanitize_title = lru_cache(maxsize=MEMO_SIZE)(self._sanitize_title)
+        self.featuring_artist = lru_cache(maxsize=MEMO_SIZE)(self._featuring_artist)
+
+    def _sanitize_title(self, title: str) -> str:
+        """Title without the removed parts like (Remastered), [Radio Edit], etc. and with collapsed whitespace"""
+
+        sanitized = self._title_removals.sub("", title.strip())
+        return _WHITESPACE.sub(" ", sanitized).strip()
+
+    def _featuring_artist(self, title: str) -> str | None:
+        """Featured artist mentioned in the title, if any"""
+
+        for pattern in self._featuring:
+            if match := pattern.search(title):
+                return match.group(1).strip()
+        return None
+
+    def add_featuring_artists(self, title: str, artists: list[str]) -> list[str]:
+        """Add the featured artist of the title to the artists, unless it is already one of them"""
+
+        featuring_artist = self.featuring_artist(title)
+        if featuring_artist and _casefold(featuring_artist) not in {_casefold(artist) for artist in artists}:
+            return [*artists, featuring_artist]
+        return artists
+
+
+@lru_cache(maxsize=MEMO_SIZE)
+def _casefold(artist: str) -> str:
+    return artist.lower()
+
+
+@cache
+def get_normalizer(rules: NormalizationRules = DEFAULT_RULES) -> TitleNormalizer:
+    """Normalizer of the rules, compiled once per process"""
+    return TitleNormalizer(rules)
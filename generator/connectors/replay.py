@@ -0,0 +1,231 @@
+"""Record and replay of the HTTP traffic of the connectors, to test and benchmark them offline.
+
+In record mode the responses of the music service are stored in a cassette, a JSON file per connector. In replay mode the
+requests are sent to a local stand-in server that answers from the cassette, optionally with added latency, rate limits
+(429) and server errors (503). The connectors use their real sessions, retries and concurrency in both modes.
+"""
+
+import json
+import random
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from enum import StrEnum
+from functools import cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+import requests.adapters
+
+from generator.logger import info
+from generator.utils import get_env_var
+
+# fields of recorded JSON responses that hold credentials, e.g. the Spotify access token
+REDACTED_FIELDS = frozenset({"access_token", "refresh_token"})
+
+# original host of a request that is sent to the stand-in server
+_HOST_HEADER = "X-Replay-Host"
+
+
+class HTTPMode(StrEnum):
+    LIVE = "live"
+    RECORD = "record"
+    REPLAY = "replay"
+
+
+@dataclass(frozen=True)
+class Faults:
+    """Faults injected by the stand-in server, the rates are the probabilities per request"""
+
+    latency_ms: float = 0.0
+    rate_limit_rate: float = 0.0
+    error_rate: float = 0.0
+    retry_after: int = 1
+    seed: int = 0
+
+
+def get_faults() -> Faults:
+    """Get the faults to inject on replay from the environment"""
+
+    return Faults(
+        latency_ms=float(get_env_var("HTTP_REPLAY_LATENCY_MS", "0")),
+        rate_limit_rate=float(get_env_var("HTTP_REPLAY_RATE_LIMIT", "0")),
+        error_rate=float(get_env_var("HTTP_REPLAY_ERROR_RATE", "0")),
+        retry_after=int(get_env_var("HTTP_REPLAY_RETRY_AFTER", "1")),
+        seed=int(get_env_var("HTTP_REPLAY_SEED", "0")),
+    )
+
+
+def request_key(method: str, host: str, path: str, query: str) -> str:
+    """Key of a request in a cassette, independent of the order of the query parameters"""
+    return f"{method} {host}{path}?{urlencode(sorted(parse_qsl(query, keep_blank_values=True)))}"
+
+
+def _redact(body: str) -> str:
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    if not isinstance(data, dict) or not REDACTED_FIELDS & data.keys():
+        return body
+    return json.dumps({key: "redacted" if key in REDACTED_FIELDS else value for key, value in data.items()})
+
+
+class Cassette:
+    """Recorded responses by request key, shared by the threads of a connector"""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.interactions: dict[str, dict] = {}
+        if path.exists():
+            with path.open("r", encoding="utf-8") as file:
+                self.interactions = json.load(file)
+
+    def get(self, key: str) -> dict | None:
+        return self.interactions.get(key)
+
+    def record(self, key: str, response: requests.Response) -> None:
+        """Store the response and save the cassette, so an interrupted recording keeps what it got so far"""
+
+        interaction = {
+            "status": response.status_code,
+            "content_type": response.headers.get("Content-Type", "application/json"),
+            "body": _redact(response.text),
+        }
+        with self._lock:
+            self.interactions[key] = interaction
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=self.path.parent, delete=False) as file:
+                json.dump(self.interactions, file, indent=2, ensure_ascii=False)
+            Path(file.name).replace(self.path)
+
+
+class RecordingAdapter(requests.adapters.HTTPAdapter):
+    """Adapter sending requests to the music service and recording the successful responses"""
+
+    def __init__(self, cassette: Cassette, **kwargs):
+        super().__init__(**kwargs)
+        self.cassette = cassette
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        response = super().send(request, **kwargs)
+        # a rejected token or a rate limit mustn't replace the answer of a request, errors are injected on replay
+        if 200 <= response.status_code < 300:
+            url = urlsplit(request.url)
+            self.cassette.record(request_key(request.method, url.netloc, url.path, url.query), response)
+        return response
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """Local stand-in for the music service answering from a cassette"""
+
+    def __init__(self, cassette: Cassette, faults: Faults):
+        super().__init__(("127.0.0.1", 0), _ReplayHandler)
+        self.cassette = cassette
+        self.faults = faults
+        self._lock = threading.Lock()
+        self._attempts: dict[str, int] = {}
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+    def draw_fault(self, key: str) -> float:
+        """Random number deciding the fault of a request, the same for the same attempt regardless of thread timing"""
+
+        with self._lock:
+            attempt = self._attempts.get(key, 0)
+            self._attempts[key] = attempt + 1
+        return random.Random(f"{self.faults.seed}:{key}:{attempt}").random()
+
+
+class _ReplayHandler(BaseHTTPRequestHandler):
+    server: ReplayServer
+
+    # keep-alive, so the connection pools of the connectors are used like with the music service
+    protocol_version = "HTTP/1.1"
+
+    def _replay(self) -> None:
+        # the body isn't part of the key, but has to be consumed before the next request on the connection
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        url = urlsplit(self.path)
+        key = request_key(self.command, self.headers.get(_HOST_HEADER, ""), url.path, url.query)
+        faults = self.server.faults
+
+        if faults.latency_ms:
+            time.sleep(faults.latency_ms / 1000)
+
+        draw = self.server.draw_fault(key)
+        interaction = self.server.cassette.get(key)
+        if draw < faults.rate_limit_rate:
+            self._respond(
+                429, "application/json", '{"error": "rate limited"}', {"Retry-After": str(faults.retry_after)}
+            )
+        elif draw < faults.rate_limit_rate + faults.error_rate:
+            self._respond(503, "application/json", '{"error": "service unavailable"}')
+        elif interaction is None:
+            self._respond(404, "application/json", json.dumps({"error": f"not recorded: {key}"}))
+        else:
+            self._respond(interaction["status"], interaction["content_type"], interaction["body"])
+
+    def _respond(self, status: int, content_type: str, body: str, headers: dict[str, str] | None = None) -> None:
+        content = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(content)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _replay
+
+    def log_message(self, *_) -> None:
+        pass
+
+
+class ReplayAdapter(requests.adapters.HTTPAdapter):
+    """Adapter sending requests to the stand-in server instead of the music service"""
+
+    def __init__(self, server: ReplayServer, **kwargs):
+        super().__init__(**kwargs)
+        self.server = server
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        url = urlsplit(request.url)
+        request.headers[_HOST_HEADER] = url.netloc
+        request.url = f"{self.server.base_url}{url.path}{'?' + url.query if url.query else ''}"
+        return super().send(request, **kwargs)
+
+
+@cache
+def _get_cassette(path: Path) -> Cassette:
+    return Cassette(path)
+
+
+@cache
+def _get_replay_server(path: Path, faults: Faults) -> ReplayServer:
+    """Stand-in server of a cassette and faults, started once per process"""
+
+    cassette = _get_cassette(path)
+    if not cassette.interactions:
+        raise FileNotFoundError(f"No recorded responses in {path}, record them with HTTP_MODE=record first")
+
+    server = ReplayServer(cassette, faults)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    info(f"Replaying {len(cassette.interactions)} responses of {path} from {server.base_url}")
+    return server
+
+
+def create_adapter(name: str, mode: HTTPMode, **kwargs) -> requests.adapters.HTTPAdapter:
+    """Adapter recording to or replaying from the cassette of the given connector"""
+
+    path = Path(get_env_var("HTTP_CASSETTE_DIR", "cassettes")) / f"{name}.json"
+    if mode == HTTPMode.RECORD:
+        return RecordingAdapter(_get_cassette(path), **kwargs)
+    return ReplayAdapter(_get_replay_server(path, get_faults()), **kwargs)
@@ -1,74 +1,143 @@
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+
 import spotipy
+from spotipy.cache_handler import CacheFileHandler, MemoryCacheHandler
+from urllib3.util import Retry
 
+from generator.cache import get_cache_dir
+from generator.connectors.http import RETRY_STATUS_CODES, create_session, is_live_http
 from generator.connectors.interfaces import Connector, Song, Source
 from generator.logger import skip
-from generator.utils import get_env_var
+from generator.utils import get_env_var, get_fetch_workers
 
 
 class SpotifyConnector(Connector):
     """Spotify API connector"""
 
+    source = Source.SPOTIFY
+
+    _PAGE_SIZE = 100
+
+    # Only the fields used to build the songs are requested
+    _ITEM_FIELDS = "items(track(id,name,preview_url,external_urls(spotify),artists(name),album(release_date)))"
+
     def __init__(self):
         self._USE_PREVIEW_URL = get_env_var("SPOTIFY_USE_PREVIEW_URL", "false").lower() == "true"
+        self._fetch_workers = get_fetch_workers()
+
+        client_id = get_env_var("SPOTIFY_CLIENT_ID")
+
+        if is_live_http():
+            # Client credentials tokens are valid for an hour, keep them across runs
+            token_cache_path = get_cache_dir() / "spotify" / f"token-{client_id}.json"
+            token_cache_path.parent.mkdir(parents=True, exist_ok=True)
+            cache_handler = CacheFileHandler(cache_path=str(token_cache_path))
+        else:
+            # recorded and replayed tokens are redacted and must not replace the cached real one
+            cache_handler = MemoryCacheHandler()
+
+        session = create_session(
+            self._fetch_workers,
+            retry=Retry(
+                total=5,
+                backoff_factor=0.5,
+                status_forcelist=RETRY_STATUS_CODES,
+                allowed_methods=frozenset({"GET"}),
+                respect_retry_after_header=True,
+            ),
+            name=str(self.source),
+        )
+
+        # token requests share the session, so they are counted, recorded and replayed like the API requests
         self._client = spotipy.Spotify(
             auth_manager=spotipy.SpotifyClientCredentials(
-                client_id=get_env_var("SPOTIFY_CLIENT_ID"),
+                client_id=client_id,
                 client_secret=get_env_var("SPOTIFY_CLIENT_SECRET"),
-            )
+                cache_handler=cache_handler,
+                requests_session=session,
+            ),
+            requests_session=session,
         )
 
-    def get_playlist_songs(self, playlist_id: str) -> list[Song]:
-        """Get songs from a Spotify playlist"""
+    def iter_playlist_songs(self, playlist_id: str) -> Iterator[list[Song]]:
+        """Yield songs from a Spotify playlist page by page"""
 
-        songs: list[Song] = []
-        results = self._client.playlist_tracks(playlist_id)
-
-        while results:
-            for item in results["items"]:
+        for page in self._iter_playlist_pages(playlist_id):
+            songs: list[Song] = []
+            for item in page["items"]:
                 track = item["track"]
                 if track:
-                    name = track.get("name", None)
-                    if not name:
-                        skip(f"Song {track.get('id', 'Unknown')}", "no name")
-                        continue
-
-                    artists = track.get("artists", [])
-                    if not artists or len(artists) == 0:
-                        skip(f"'{name}'", "no artist")
-                        continue
-
-                    year = self._resolve_year(track["album"]["release_date"])
-                    if int(year) <= 0:
-                        skip(f"'{name}'", "no release year")
-                        continue
-
-                    if self._USE_PREVIEW_URL:
-                        url = track.get("preview_url", None)
-                        if not url:
-                            skip(f"'{name}'", "no preview URL")
-                            continue
-                    else:
-                        url = track.get("external_urls", {}).get("spotify", None)
-                        if not url:
-                            skip(f"'{name}'", "no external URL")
-                            continue
-
-                    songs.append(
-                        Song(
-                            id=track["id"],
-                            title=self.sanitize_song_title(name),
-                            artists=self.add_featuring_artists(
-                                name, [artist.get("name", "Unknown") for artist in artists]
-                            ),
-                            year=year,
-                            url=url,
-                            source=Source.SPOTIFY,
-                        )
-                    )
-
-            results = self._client.next(results) if results["next"] else None
-
-        return songs
+                    song = self._parse_song(track)
+                    if song:
+                        songs.append(song)
+            yield songs
+
+    def get_playlist_version(self, playlist_id: str) -> str | None:
+        """The snapshot ID of the playlist, which changes with every modification"""
+
+        snapshot_id = self._client.playlist(playlist_id, fields="snapshot_id")["snapshot_id"]
+        return f"{snapshot_id}:preview-url={self._USE_PREVIEW_URL}"
+
+    def _get_playlist_page(self, playlist_id: str, offset: int, fields: str) -> dict:
+        return self._client.playlist_items(
+            playlist_id,
+            fields=fields,
+            limit=self._PAGE_SIZE,
+            offset=offset,
+            additional_types=("track",),
+        )
+
+    def _iter_playlist_pages(self, playlist_id: str) -> Iterator[dict]:
+        """Fetch all item pages of a playlist in order, the pages after the first one concurrently by offset"""
+
+        first_page = self._get_playlist_page(playlist_id, 0, f"total,{self._ITEM_FIELDS}")
+        yield first_page
+
+        offsets = range(self._PAGE_SIZE, first_page["total"], self._PAGE_SIZE)
+        with ThreadPoolExecutor(max_workers=self._fetch_workers) as executor:
+            yield from executor.map(
+                lambda offset: self._get_playlist_page(playlist_id, offset, self._ITEM_FIELDS),
+                offsets,
+            )
+
+    def _parse_song(self, track: dict) -> Song | None:
+        """Convert a track object of the API to a song, None if required data is missing"""
+
+        name = track.get("name")
+        if not name:
+            skip(f"Song {track.get('id', 'Unknown')}", "no name")
+            return None
+
+        artists = track.get("artists", [])
+        if not artists or len(artists) == 0:
+            skip(f"'{name}'", "no artist")
+            return None
+
+        year = self._resolve_year(track["album"]["release_date"])
+        if int(year) <= 0:
+            skip(f"'{name}'", "no release year")
+            return None
+
+        if self._USE_PREVIEW_URL:
+            url = track.get("preview_url")
+            if not url:
+                skip(f"'{name}'", "no preview URL")
+                return None
+        else:
+            url = track.get("external_urls", {}).get("spotify", None)
+            if not url:
+                skip(f"'{name}'", "no external URL")
+                return None
+
+        return Song(
+            id=track["id"],
+            title=self.sanitize_song_title(name),
+            artists=self.add_featuring_artists(name, [artist.get("name", "Unknown") for artist in artists]),
+            year=year,
+            url=url,
+            source=Source.SPOTIFY,
+        )
 
     def _resolve_year(self, date: str) -> int:
         date_parts = date.split("-")[::-1]
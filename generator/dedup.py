@@ -0,0 +1,145 @@
+"""Detection of the same song appearing multiple times in a playlist, e.g. as remaster, live version or compilation copy."""
+
+import heapq
+import math
+import re
+import unicodedata
+from collections import defaultdict
+from difflib import SequenceMatcher
+from typing import NamedTuple
+
+from generator.connectors import Song
+from generator.logger import item
+
+# minimum similarity of the normalized titles of the same artist to count as the same song
+FUZZY_THRESHOLD = 0.9
+
+# length of the title prefix fuzzy candidates are bucketed by, only titles in the same bucket are compared
+FUZZY_PREFIX_LENGTH = 4
+
+_BRACKETS = re.compile(r"\([^)]*\)|\[[^\]]*\]")
+_DASH_SUFFIX = re.compile(r"\s+-\s+.*$")
+_FEATURING = re.compile(r"\b(feat|ft|featuring)\b.*$")
+# removed instead of separating words, so "Don't" and "Dont" are equal
+_APOSTROPHES = re.compile(r"['\u2019\u02bc`]")
+_NON_ALPHANUMERIC = re.compile(r"[\W_]+")
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize_text(text: str) -> str:
+    """Casefolded text without accents and punctuation"""
+
+    text = "".join(char for char in unicodedata.normalize("NFKD", text) if not unicodedata.combining(char))
+    return _NON_ALPHANUMERIC.sub(" ", _APOSTROPHES.sub("", text.casefold())).strip()
+
+
+def normalize_title(title: str) -> str:
+    """Title without version details, like (Live), [2011 Remaster], - Single Version or featured artists"""
+
+    stripped = _DASH_SUFFIX.sub("", _BRACKETS.sub("", title))
+    # titles consisting only of details, e.g. "(Intro)", are kept as they are
+    return normalize_text(_FEATURING.sub("", stripped.lower())) or normalize_text(title)
+
+
+def title_artist_key(title: str, artists: list[str]) -> tuple[str, str]:
+    """Normalized title and primary artist"""
+    return normalize_title(title), normalize_text(artists[0]) if artists else ""
+
+
+def song_key(song: Song) -> tuple[str, str]:
+    """Normalized title and primary artist, equal for exact duplicates"""
+    return title_artist_key(song.title, song.artists)
+
+
+class _Representative(NamedTuple):
+    key: tuple[str, str]
+    digits: list[str]
+    # compares other titles to the title of the key, which it analyzes only once
+    matcher: SequenceMatcher
+
+
+def _is_similar_title(title: str, digits: list[str], representative: _Representative) -> bool:
+    # numbers tell different songs apart even if the rest is equal, e.g. "Symphony No. 5" and "Symphony No. 9"
+    if digits != representative.digits:
+        return False
+    representative.matcher.set_seq1(title)
+    # quick_ratio is a cheap upper bound of ratio
+    return representative.matcher.quick_ratio() >= FUZZY_THRESHOLD and representative.matcher.ratio() >= FUZZY_THRESHOLD
+
+
+def _similar_lengths(length: int) -> range:
+    """Lengths of titles that can be similar to a title of the given length
+
+    The similarity of two titles is at most 2 * shorter / (shorter + longer), so titles of very different lengths are
+    never similar.
+    """
+
+    shortest = length * FUZZY_THRESHOLD / (2 - FUZZY_THRESHOLD)
+    longest = length * (2 - FUZZY_THRESHOLD) / FUZZY_THRESHOLD
+    return range(math.ceil(shortest - 1e-9), math.floor(longest + 1e-9) + 1)
+
+
+class _Representatives:
+    """First group key of every fuzzy match group of a bucket, indexed by title length"""
+
+    def __init__(self):
+        self._by_length: dict[int, list[tuple[int, _Representative]]] = defaultdict(list)
+        self._count = 0
+
+    def add(self, key: tuple[str, str]) -> None:
+        representative = _Representative(key, _DIGITS.findall(key[0]), SequenceMatcher(None, b=key[0]))
+        self._by_length[len(key[0])].append((self._count, representative))
+        self._count += 1
+
+    def find_similar(self, title: str) -> tuple[str, str] | None:
+        """Key of the first added representative with a similar title, only those of similar length are compared"""
+
+        digits = _DIGITS.findall(title)
+        lengths = [self._by_length[length] for length in _similar_lengths(len(title)) if length in self._by_length]
+        for _, representative in heapq.merge(*lengths, key=lambda entry: entry[0]):
+            if _is_similar_title(title, digits, representative):
+                return representative.key
+        return None
+
+
+def deduplicate_songs(songs: list[Song]) -> list[Song]:
+    """Merge the versions of the same song into the one with the earliest year, keeping the playlist order
+
+    Songs are grouped by an exact hash of their key first. The remaining groups of an artist are then compared fuzzily,
+    but only within buckets of the same title prefix and with titles of similar length, so the work stays close to
+    linear in the number of songs.
+    """
+
+    groups: dict[tuple[str, str], list[tuple[int, Song]]] = defaultdict(list)
+    for position, song in enumerate(songs):
+        groups[song_key(song)].append((position, song))
+
+    fuzzy_buckets: dict[tuple[str, str], list[tuple[str, str]]] = defaultdict(list)
+    for title, artist in groups:
+        fuzzy_buckets[artist, title[:FUZZY_PREFIX_LENGTH]].append((title, artist))
+
+    merged_into: dict[tuple[str, str], tuple[str, str]] = {}
+    for keys in fuzzy_buckets.values():
+        representatives = _Representatives()
+        for key in keys:
+            match = representatives.find_similar(key[0])
+            if match is None:
+                representatives.add(key)
+            else:
+                merged_into[key] = match
+
+    for key, target in merged_into.items():
+        groups[target].extend(groups.pop(key))
+
+    kept_positions: set[int] = set()
+    for group in groups.values():
+        # the first song of the playlist among those with the earliest year
+        position, kept = min(group, key=lambda entry: (entry[1].year, entry[0]))
+        kept_positions.add(position)
+        if len(group) > 1:
+            item(f"{kept.title} - {', '.join(kept.artists)} ({kept.year}): merged {len(group) - 1} other versions")
+
+    deduplicated = [song for position, song in enumerate(songs) if position in kept_positions]
+    if len(deduplicated) < len(songs):
+        item(f"Merged {len(songs) - len(deduplicated)} duplicates, {len(deduplicated)} unique songs remain")
+    return deduplicated
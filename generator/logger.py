@@ -1,6 +1,7 @@
 """Modern, fancy but minimalistic logging module using Rich."""
 
 import logging
+import math
 import sys
 import time
 
@@ -182,6 +183,34 @@ class HitsterLogger:
         if completed == total:
             sys.stdout.write("\n")
 
+    def bar_chart(self, values: dict[int, int], height: int = 12, indent: int = 2) -> None:
+        """Print a column chart of the values with Unicode block characters, labeled with the first and last key"""
+        if not values:
+            return
+
+        keys = list(values)
+        width = self.HEADER_LENGTH - indent
+
+        # Merge neighboring keys into one column if there are more keys than fit the line
+        group_size = math.ceil(len(keys) / width)
+        columns = [sum(values[key] for key in keys[i : i + group_size]) for i in range(0, len(keys), group_size)]
+        column_width = max(1, min(3, width // len(columns)))
+        peak = max(columns) or 1
+
+        # Eighth blocks give every row 8 steps of resolution
+        blocks = " ▁▂▃▄▅▆▇█"
+        for row in range(height - 1, -1, -1):
+            line = ""
+            for value in columns:
+                eighths = round(value / peak * height * 8) - row * 8
+                line += blocks[max(0, min(8, eighths))] * column_width
+            console.print(f"{' ' * indent}[accent]{line}[/accent]")
+
+        first, last = str(keys[0]), str(keys[-1])
+        axis = first + last.rjust(len(columns) * column_width - len(first))
+        console.print(f"{' ' * indent}[muted]{axis}[/muted]")
+        console.print(f"{' ' * indent}[muted]Highest column: {peak}[/muted]")
+
     def _format_time(self, seconds: float) -> str:
         """Format time in a human-readable way"""
         if seconds < 60:
@@ -212,3 +241,4 @@ newline = logger.newline
 progress_start = logger.progress_start
 progress_stop = logger.progress_stop
 progress_bar = logger.progress_bar
+bar_chart = logger.bar_chart
@@ -1,93 +1,241 @@
-import json
+import os
 import random
 import shutil
+from collections.abc import Iterator
 from pathlib import Path
 
-import term_image.image
 from dotenv import load_dotenv
-from term_image.exceptions import InvalidSizeError
 
-from generator.connectors import resolve_connector
-from generator.logger import HitsterLogger, header, section, step, success, warning
+from generator.batch import GENERATED_DIR, Deck, get_decks
+from generator.connectors import Connector, PlaylistCache, Song, iter_songs_json, resolve_connector
+from generator.dedup import deduplicate_songs
+from generator.logger import bar_chart, error, header, item, newline, section, step, success, warning
+from generator.manifest import BuildManifest
+from generator.metrics import metrics
+from generator.overrides import OVERRIDES_JSON_PATH, OverrideStore
+from generator.pipeline import Stage, StageScheduler
 from generator.render import generate_cards_pdf, generate_qr_codes, generate_year_distribution
+from generator.render.executor import RenderExecutor
 from generator.render.images import generate_decoration_images
-from generator.themes import Theme
-from generator.utils import get_env_var
+from generator.render.qr import prepare_embedded_images
+from generator.selection import get_selection_config, select_songs
+from generator.utils import get_env_flag
+from generator.watch import watch_changes
 
 
-def main() -> None:
-    """Main function to generate the cards and overview PDF"""
+def write_songs_json(songs: list[Song], path: Path) -> None:
+    """Save the songs to a JSON file, written song by song"""
 
-    random.seed("hitster")
-    load_dotenv()
+    with path.open("w", encoding="utf-8") as file:
+        file.writelines(iter_songs_json(songs))
 
-    theme = Theme(get_env_var("THEME", Theme.BLACK_WHITE))
 
-    header("🎵 Hitster Card Generator")
+def watch_cards(
+    deck: Deck,
+    playlist_songs: list[Song],
+    songs: list[Song],
+    manifest: BuildManifest,
+    overrides: OverrideStore,
+    executor: RenderExecutor,
+) -> None:
+    """Recompile the cards PDF whenever overrides.json or a Typst theme changes, until interrupted
+
+    The deck keeps its songs, changed overrides are imported and only applied to them, as the other songs don't have QR
+    codes.
+    """
 
-    section("Retrieving Songs")
-    step("Connecting to music service...")
-    connector = resolve_connector()
-
-    step("Fetching playlist songs...")
-    songs = connector.get_playlist_songs(get_env_var("PLAYLIST_ID"))
-    success(f"Retrieved {len(songs)} songs")
-
-    if Path("generated").is_dir():
-        shutil.rmtree("generated")
-    Path("generated").mkdir(parents=True, exist_ok=True)
-
-    section("Processing Data")
-    if Path("overrides.json").exists():
-        step("Applying overrides from overrides.json...")
-        with Path("overrides.json").open("r", encoding="utf-8") as file:
-            overrides = json.load(file)
-            override_map = {override["id"]: override for override in overrides}
-            for i, song in enumerate(songs):
-                if song.id in override_map:
-                    override_data = override_map[song.id]
-                    override_data = {k: v for k, v in override_data.items() if k != "id"}
-                    songs[i] = song.model_copy(update=override_data)
-        success("Overrides applied")
-
-    step("Sorting songs by year...")
-    songs.sort(key=lambda song: song.year)
-    success("Songs sorted by year")
-
-    step("Writing songs to JSON file...")
-    with Path("generated/songs.json").open("w", encoding="utf-8") as file:
-        json.dump([song.model_dump() for song in songs], file, indent=4, ensure_ascii=False)
-    success("Songs data saved to generated/songs.json")
+    song_ids = {song.id for song in songs}
+
+    def watched_paths() -> list[Path]:
+        return [OVERRIDES_JSON_PATH, *Path("generator/themes").rglob("*.typ")]
+
+    step("Watching overrides.json and the Typst themes, press Ctrl+C to stop...")
+    try:
+        for changed in watch_changes(watched_paths):
+            item(f"Changed {', '.join(sorted(str(path) for path in changed))}")
+
+            if OVERRIDES_JSON_PATH in changed:
+                overrides.import_json_if_changed()
+                deck_songs = (song for song in playlist_songs if song.id in song_ids)
+                songs = sorted(overrides.apply(deck_songs), key=lambda song: song.year)
+                write_songs_json(songs, deck.output_dir / "songs.json")
+
+            try:
+                generate_cards_pdf(
+                    deck.theme, str(deck.output_dir / "hitster.pdf"), songs, manifest, executor, deck.qr_codes_dir
+                )
+                success("Cards PDF recompiled")
+            except Exception as e:
+                # keep watching, the next change probably fixes it
+                error(f"Error compiling cards PDF: {e}")
+    except KeyboardInterrupt:
+        newline()
+
+
+def build_deck(
+    deck: Deck,
+    connector: Connector,
+    overrides: OverrideStore,
+    manifest: BuildManifest,
+    executor: RenderExecutor,
+) -> tuple[list[Song], list[Song]]:
+    """Fetch the songs of a deck and build its assets and PDFs, returns the playlist songs and the songs of the deck"""
+
+    deck.output_dir.mkdir(parents=True, exist_ok=True)
+
+    playlist_songs: list[Song] = []
+    songs: list[Song] = []
+
+    def fetch_songs() -> Iterator[Song]:
+        pages = PlaylistCache().iter_playlist_songs(
+            connector,
+            deck.playlist_id,
+            refresh=get_env_flag("REFRESH_PLAYLIST"),
+        )
+        for page in pages:
+            playlist_songs.extend(page)
+            page_songs = overrides.apply(page)
+            songs.extend(page_songs)
+            yield from page_songs
+
+    deduplicate = get_env_flag("DEDUPLICATE")
+    selection = get_selection_config()
+    year_counts: dict[int, int] = {}
+
+    def fetch_songs_and_qr_codes() -> None:
+        if selection is None and not deduplicate:
+            # QR codes only depend on a single song, so they are rendered while the playlist is still downloading
+            step("Fetching playlist songs and creating QR codes...")
+            generate_qr_codes(deck.theme, fetch_songs(), manifest, executor, deck.qr_codes_dir)
+        else:
+            # deduplication and selection need all songs, only the remaining ones get QR codes
+            step("Fetching playlist songs...")
+            playlist_size = len(list(fetch_songs()))
+            if deduplicate:
+                step(f"Merging duplicates of {playlist_size} songs...")
+                songs[:] = deduplicate_songs(songs)
+            if selection is not None:
+                step(f"Selecting {selection.count} of {len(songs)} songs...")
+                songs[:] = select_songs(songs, selection)
+            step("Creating QR codes...")
+            generate_qr_codes(deck.theme, songs, manifest, executor, deck.qr_codes_dir)
+
+        # sorted before any dependent stage reads them
+        songs.sort(key=lambda song: song.year)
+        success(f"Retrieved {len(songs)} songs and generated their QR codes")
+
+    def save_songs() -> None:
+        step("Writing songs sorted by year to JSON file...")
+        write_songs_json(songs, deck.output_dir / "songs.json")
+        success(f"Songs data saved to {deck.output_dir / 'songs.json'}")
+
+    def create_decoration_images() -> None:
+        step("Generating decoration images...")
+        generate_decoration_images(deck.theme, manifest, executor)
+        success("Decoration images generated")
+
+    def build_cards_pdf() -> None:
+        step("Building cards PDF...")
+        generate_cards_pdf(
+            deck.theme, str(deck.output_dir / "hitster.pdf"), songs, manifest, executor, deck.qr_codes_dir
+        )
+        success("Cards PDF created")
+
+    def create_year_distribution() -> None:
+        step("Creating year distribution chart...")
+        year_counts.update(generate_year_distribution(songs, str(deck.output_dir / "year-distribution.pdf")))
+        success("Year distribution chart created")
 
     section("Generating Assets")
+    # the worker processes are started by the first stage and decode the embedded images on startup
+    executor.warm_up_images(prepare_embedded_images(deck.theme, manifest))
+    scheduler = StageScheduler(
+        [
+            Stage("songs", fetch_songs_and_qr_codes, outputs=frozenset({"songs", "qr-codes"})),
+            Stage("decoration-images", create_decoration_images, outputs=frozenset({"decoration-images"})),
+            Stage("songs-json", save_songs, frozenset({"songs"}), frozenset({"songs.json"})),
+            # the songs are passed to Typst in memory, so it doesn't wait for songs.json
+            Stage(
+                "cards-pdf",
+                build_cards_pdf,
+                frozenset({"songs", "qr-codes", "decoration-images"}),
+                frozenset({"cards-pdf"}),
+            ),
+            Stage("year-distribution", create_year_distribution, frozenset({"songs"}), frozenset({"charts"})),
+        ],
+        profile_stage=os.getenv("PROFILE_STAGE"),
+        profile_dir=deck.output_dir,
+    )
+    scheduler.run()
+
+    section("Build Timings")
+    scheduler.report()
+    for name, timing in scheduler.timings.items():
+        metrics.record_stage(f"{deck.name}/{name}", timing.duration, timing.cpu_time)
 
-    step("Generating decoration images...")
-    generate_decoration_images(theme)
-    success("Decoration images generated")
+    section("Song Year Distribution")
+    bar_chart(year_counts)
 
-    step("Creating QR codes...")
-    generate_qr_codes(theme, songs)
-    success("QR codes generated")
+    return playlist_songs, songs
 
-    step("Building cards PDF...")
-    generate_cards_pdf("generated/hitster.pdf")
-    success("Cards PDF created")
 
-    step("Creating year distribution charts...")
-    generate_year_distribution(songs, "generated/year-distribution.pdf", "generated/year-distribution.png")
-    success("Year distribution charts created")
+def main() -> None:
+    """Main function to generate the cards and overview PDF of every deck"""
 
-    section("Song Year Distribution")
-    try:
-        analysis_file = term_image.image.from_file("generated/year-distribution.png", width=HitsterLogger.HEADER_LENGTH)
-        analysis_file.draw(h_align="left", pad_height=analysis_file.height)
-    except InvalidSizeError:
-        # If the image is too large for the terminal, skip display
-        warning("Year distribution chart is too large to display in terminal")
-    finally:
-        Path("generated/year-distribution.png").unlink()
-
-    header("🚀 Generation Complete!")
+    random.seed("hitster")
+    load_dotenv()
+
+    header("🎵 Hitster Card Generator")
+
+    decks = get_decks()
+    if len(decks) > 1:
+        item(f"Building {len(decks)} decks: {', '.join(deck.name for deck in decks)}")
+
+    incremental = get_env_flag("INCREMENTAL_BUILD")
+    if GENERATED_DIR.is_dir() and not incremental:
+        shutil.rmtree(GENERATED_DIR)
+    GENERATED_DIR.mkdir(parents=True, exist_ok=True)
+    if incremental:
+        item("Incremental build, unchanged assets are reused")
+
+    overrides = OverrideStore()
+    imported = overrides.import_json_if_changed()
+    if imported is not None:
+        item(f"Imported {imported} overrides from {OVERRIDES_JSON_PATH}")
+    if len(overrides):
+        item(f"Applying {len(overrides)} overrides from {overrides.path}")
+
+    # shared by all decks, so tokens, HTTP sessions and the warm worker processes are reused
+    connectors: dict[str, Connector] = {}
+
+    with RenderExecutor() as executor:
+        for deck in decks:
+            if len(decks) > 1:
+                header(f"🎴 Deck {deck.name}")
+
+            if deck.provider not in connectors:
+                section("Retrieving Songs")
+                step("Connecting to music service...")
+                connectors[deck.provider] = resolve_connector(deck.provider)
+
+            manifest = BuildManifest(deck.output_dir / "manifest.json", enabled=incremental)
+            playlist_songs, songs = build_deck(deck, connectors[deck.provider], overrides, manifest, executor)
+
+        metrics_file = os.getenv("METRICS_FILE")
+        if metrics_file:
+            metrics.write(Path(metrics_file))
+            item(f"Build metrics saved to {metrics_file}")
+
+        header("🚀 Generation Complete!")
+
+        if get_env_flag("WATCH"):
+            if len(decks) > 1:
+                warning("Watch mode is only available for a single deck")
+                return
+
+            # within the executor, so recompiles of large decks use the warm worker processes
+            section("Watching for Changes")
+            watch_cards(decks[0], playlist_songs, songs, manifest, overrides, executor)
 
 
 if __name__ == "__main__":
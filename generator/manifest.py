@@ -0,0 +1,103 @@
+"""Build manifest that records the input hashes of generated artifacts for incremental builds."""
+
+import hashlib
+import json
+import threading
+from collections.abc import Iterable
+from pathlib import Path
+
+MANIFEST_PATH = Path("generated/manifest.json")
+MANIFEST_VERSION = 1
+
+_file_hashes: dict[tuple[str, int, int], str] = {}
+
+
+def hash_inputs(*parts: object) -> str:
+    """Hash the given inputs (bytes or JSON serializable values) into a stable hex digest"""
+
+    digest = hashlib.sha256()
+    for part in parts:
+        data = part if isinstance(part, bytes) else json.dumps(part, sort_keys=True, default=str).encode("utf-8")
+        digest.update(len(data).to_bytes(8, "big"))
+        digest.update(data)
+    return digest.hexdigest()
+
+
+def hash_file(path: Path) -> str:
+    """Hash the content of a file, memoized by path, modification time and size"""
+
+    stat = path.stat()
+    key = (str(path.absolute()), stat.st_mtime_ns, stat.st_size)
+    if key not in _file_hashes:
+        _file_hashes[key] = hashlib.sha256(path.read_bytes()).hexdigest()
+    return _file_hashes[key]
+
+
+class BuildManifest:
+    """Input hashes of all generated artifacts, grouped by build stage
+
+    A disabled manifest never reports an artifact as fresh, so every stage does a full rebuild. It is shared by stages
+    that run concurrently, so all changes are made under a lock.
+    """
+
+    def __init__(self, path: Path = MANIFEST_PATH, enabled: bool = True):
+        self.path = path
+        self.enabled = enabled
+        self._lock = threading.RLock()
+        self._stages: dict[str, dict[str, str]] = self._load() if enabled else {}
+
+    def _load(self) -> dict[str, dict[str, str]]:
+        """Load the manifest from disk, discarding it if it is missing, corrupt or outdated"""
+
+        if not self.path.exists():
+            return {}
+
+        try:
+            with self.path.open("r", encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, json.JSONDecodeError):
+            return {}
+
+        if data.get("version") != MANIFEST_VERSION:
+            return {}
+        return data.get("stages", {})
+
+    def is_fresh(self, stage: str, key: str, digest: str, output: Path) -> bool:
+        """Check whether the output of an artifact exists and was built from the same inputs"""
+        return self.enabled and self._stages.get(stage, {}).get(key) == digest and output.exists()
+
+    def record(self, stage: str, key: str, digest: str) -> None:
+        """Record the input hash of a successfully built artifact"""
+        with self._lock:
+            self._stages.setdefault(stage, {})[key] = digest
+
+    def forget(self, stage: str, key: str) -> None:
+        """Remove an artifact from the manifest, e.g. after it failed to build"""
+        with self._lock:
+            self._stages.get(stage, {}).pop(key, None)
+
+    def prune(self, stage: str, keep: Iterable[str]) -> list[str]:
+        """Remove all artifacts of a stage that are not in keep and return their keys"""
+
+        with self._lock:
+            entries = self._stages.get(stage, {})
+            stale = sorted(set(entries) - set(keep))
+            for key in stale:
+                del entries[key]
+            return stale
+
+    def stage_digest(self, stage: str) -> str:
+        """Hash of all artifact hashes of a stage, used as input for dependent stages"""
+        with self._lock:
+            return hash_inputs(self._stages.get(stage, {}))
+
+    def save(self) -> None:
+        """Write the manifest to disk"""
+
+        if not self.enabled:
+            return
+
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with self.path.open("w", encoding="utf-8") as file:
+                json.dump({"version": MANIFEST_VERSION, "stages": self._stages}, file, indent=4)
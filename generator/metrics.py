@@ -0,0 +1,112 @@
+"""Build metrics: stage times, worker task latencies, HTTP traffic and peak memory, written as JSON on request."""
+
+import json
+import resource
+import sys
+import threading
+from collections import defaultdict
+from pathlib import Path
+
+# upper bounds in milliseconds of the task latency histogram buckets, the last bucket is unbounded
+HISTOGRAM_BOUNDS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+
+
+def _histogram(values_ms: list[float]) -> dict:
+    """Bucket counts and percentiles of latencies in milliseconds"""
+
+    if not values_ms:
+        return {"count": 0}
+
+    buckets = dict.fromkeys([*(f"<={bound}ms" for bound in HISTOGRAM_BOUNDS_MS), f">{HISTOGRAM_BOUNDS_MS[-1]}ms"], 0)
+    for value in values_ms:
+        bound = next((bound for bound in HISTOGRAM_BOUNDS_MS if value <= bound), None)
+        buckets[f"<={bound}ms" if bound is not None else f">{HISTOGRAM_BOUNDS_MS[-1]}ms"] += 1
+
+    ordered = sorted(values_ms)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "mean_ms": round(sum(ordered) / len(ordered), 3),
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1], 3),
+        "buckets": buckets,
+    }
+
+
+def peak_rss_mb() -> float:
+    """Peak resident memory of the current process in megabytes"""
+
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+class BuildMetrics:
+    """Collects the metrics of a build, shared by the stage threads"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages: dict[str, dict[str, float]] = {}
+        self._queued_ms: dict[str, list[float]] = defaultdict(list)
+        self._executed_ms: dict[str, list[float]] = defaultdict(list)
+        self._worker_cpu_s: dict[str, float] = defaultdict(float)
+        self._largest_worker_rss_mb = 0.0
+        self.http: dict[str, dict[str, int]] = defaultdict(lambda: {"requests": 0, "bytes": 0})
+
+    def record_stage(self, name: str, wall_time: float, cpu_time: float) -> None:
+        """Record the wall time and the CPU time of the stage thread, in seconds"""
+        with self._lock:
+            self.stages[name] = {"wall_s": round(wall_time, 3), "cpu_s": round(cpu_time, 3)}
+
+    def record_tasks(self, name: str, queued: list[float], executed: list[float], worker_cpu_time: float) -> None:
+        """Record how long worker tasks waited to be started and how long they ran, in seconds"""
+        with self._lock:
+            self._queued_ms[name].extend(seconds * 1000 for seconds in queued)
+            self._executed_ms[name].extend(seconds * 1000 for seconds in executed)
+            self._worker_cpu_s[name] += worker_cpu_time
+
+    def record_worker_memory(self, peak_rss_mb: float) -> None:
+        """Record the peak memory a worker process reported, in megabytes"""
+        with self._lock:
+            self._largest_worker_rss_mb = max(self._largest_worker_rss_mb, peak_rss_mb)
+
+    def record_http(self, connector: str, size: int) -> None:
+        """Record a HTTP response and the size of its body in bytes"""
+        with self._lock:
+            self.http[connector]["requests"] += 1
+            self.http[connector]["bytes"] += size
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "stages": dict(self.stages),
+                "tasks": {
+                    name: {
+                        "queued": _histogram(self._queued_ms[name]),
+                        "executed": _histogram(self._executed_ms[name]),
+                        "worker_cpu_s": round(self._worker_cpu_s[name], 3),
+                    }
+                    for name in self._executed_ms
+                },
+                "http": {connector: dict(counts) for connector, counts in self.http.items()},
+                "peak_rss_mb": {
+                    "main": peak_rss_mb(),
+                    # the workers aren't children of this process, they report their peak with every chunk
+                    "largest_worker": self._largest_worker_rss_mb,
+                },
+            }
+
+    def write(self, path: Path) -> None:
+        """Write the metrics as JSON file"""
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=4)
+
+
+metrics = BuildMetrics()
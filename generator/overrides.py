@@ -0,0 +1,266 @@
+"""Song overrides in an indexed SQLite store, shared by all playlists and decks.
+
+Overrides are matched by song ID first and then by the normalized title and primary artist of the song, so they still
+apply when a re-release gets a new ID. The title and artist of an override are its own, or else they are learned from the first
+song it is applied to by ID. Every override belongs
+to the file it was imported from, overrides removed from the file are removed from the store on the next import.
+overrides.json is imported whenever it changed and the store can be exported to that format again:
+
+    poetry run python -m generator.overrides import overrides.json
+    poetry run python -m generator.overrides export overrides.json
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from generator.cache import get_cache_dir
+from generator.connectors import Song
+from generator.connectors.interfaces import SONG_FIELDS
+from generator.dedup import song_key, title_artist_key
+from generator.logger import warning
+from generator.manifest import hash_inputs
+
+OVERRIDES_JSON_PATH = Path("overrides.json")
+
+# the URL and the source belong to the song of the ID, not to other releases matched by title and artist
+SONG_SPECIFIC_FIELDS = frozenset({"url", "source"})
+
+# SQLite limits the number of parameters of a statement
+_QUERY_BATCH_SIZE = 400
+
+# stores of another version are rebuilt and their files imported again, e.g. when the schema or song_key changes
+_SCHEMA_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS overrides (
+    id TEXT PRIMARY KEY,
+    title_key TEXT,
+    artist_key TEXT,
+    fields TEXT NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS overrides_song_key ON overrides (title_key, artist_key);
+CREATE INDEX IF NOT EXISTS overrides_source ON overrides (source);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT PRIMARY KEY,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL
+);
+"""
+
+
+def get_overrides_db_path() -> Path:
+    """Get OVERRIDES_DB, or else a database per project directory in the cache directory"""
+
+    if db_path := os.getenv("OVERRIDES_DB"):
+        return Path(db_path)
+    # overrides.json is the source of truth, the database only indexes it and must not be committed
+    return get_cache_dir() / "overrides" / f"{hash_inputs(str(Path.cwd().resolve()))[:16]}.db"
+
+
+def _batches(items: list, size: int = _QUERY_BATCH_SIZE) -> Iterator[list]:
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _override_key(override: dict) -> tuple[str | None, str | None]:
+    """Normalized title and primary artist of an override, None if it doesn't set both, then it is learned"""
+
+    if not override.get("title") or not override.get("artists"):
+        return None, None
+    return title_artist_key(override["title"], override["artists"])
+
+
+class OverrideStore:
+    """Overrides by song ID and by normalized title and artist, used by the stage threads under a lock"""
+
+    def __init__(self, path: Path | None = None):
+        self.path = path or get_overrides_db_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            if self._connection.execute("PRAGMA user_version").fetchone()[0] != _SCHEMA_VERSION:
+                # all overrides come from files, which are imported again as they aren't recorded as imported anymore
+                self._connection.executescript("DROP TABLE IF EXISTS overrides; DROP TABLE IF EXISTS imports;")
+            self._connection.executescript(_SCHEMA)
+            self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def __enter__(self) -> "OverrideStore":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM overrides").fetchone()[0]
+
+    def import_json(self, path: Path) -> int:
+        """Import the overrides of a file in the overrides.json format, replacing those with the same ID
+
+        The file is authoritative for the overrides imported from it before, those it doesn't contain anymore are
+        removed.
+        """
+
+        with path.open("r", encoding="utf-8") as file:
+            overrides = json.load(file)
+
+        # kept for the export, but not applied to the songs
+        unknown_fields = sorted({field for override in overrides for field in override} - SONG_FIELDS)
+        if unknown_fields:
+            warning(f"Ignoring unknown override fields in {path}: {', '.join(unknown_fields)}")
+
+        source = str(path.absolute())
+        rows = [
+            (
+                override["id"],
+                *_override_key(override),
+                json.dumps({k: v for k, v in override.items() if k != "id"}, ensure_ascii=False),
+                source,
+            )
+            for override in overrides
+        ]
+        with self._lock, self._connection:
+            self._remove_missing(source, [row[0] for row in rows])
+            # a learned title and artist is kept as long as the override doesn't change
+            self._connection.executemany(
+                "INSERT INTO overrides (id, title_key, artist_key, fields, source) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "title_key = CASE WHEN fields = excluded.fields THEN coalesce(excluded.title_key, title_key) "
+                "ELSE excluded.title_key END, "
+                "artist_key = CASE WHEN fields = excluded.fields THEN coalesce(excluded.artist_key, artist_key) "
+                "ELSE excluded.artist_key END, "
+                "fields = excluded.fields, source = excluded.source",
+                rows,
+            )
+        return len(rows)
+
+    def _remove_missing(self, source: str, song_ids: list[str]) -> None:
+        """Remove the overrides imported from the source that aren't among the given song IDs"""
+
+        self._connection.execute(
+            "DELETE FROM overrides WHERE source = ? AND id NOT IN (SELECT value FROM json_each(?))",
+            (source, json.dumps(song_ids)),
+        )
+
+    def import_json_if_changed(self, path: Path = OVERRIDES_JSON_PATH) -> int | None:
+        """Import the file unless it was already imported unchanged, returns the number of overrides
+
+        The overrides of a file that was imported before and is missing now are removed.
+        """
+
+        with self._lock:
+            imported = self._connection.execute(
+                "SELECT mtime_ns, size FROM imports WHERE path = ?", (str(path.absolute()),)
+            ).fetchone()
+
+            if not path.exists():
+                if imported is None:
+                    return None
+                with self._connection:
+                    self._remove_missing(str(path.absolute()), [])
+                    self._connection.execute("DELETE FROM imports WHERE path = ?", (str(path.absolute()),))
+                return 0
+
+            stat = path.stat()
+            if imported == (stat.st_mtime_ns, stat.st_size):
+                return None
+
+            count = self.import_json(path)
+            with self._connection:
+                self._connection.execute(
+                    "INSERT OR REPLACE INTO imports (path, mtime_ns, size) VALUES (?, ?, ?)",
+                    (str(path.absolute()), stat.st_mtime_ns, stat.st_size),
+                )
+            return count
+
+    def export_json(self, path: Path) -> int:
+        """Export all overrides in the overrides.json format, ordered by song ID"""
+
+        with self._lock:
+            rows = self._connection.execute("SELECT id, fields FROM overrides ORDER BY id").fetchall()
+
+        with path.open("w", encoding="utf-8") as file:
+            overrides = [{"id": song_id, **json.loads(fields)} for song_id, fields in rows]
+            json.dump(overrides, file, indent=4, ensure_ascii=False)
+        return len(rows)
+
+    def find(self, songs: list[Song]) -> list[dict | None]:
+        """Fields to override of every song, by ID or else by normalized title and artist
+
+        Overrides matched by title and artist don't set the song specific fields. The title and artist of overrides
+        matched by ID are stored if they aren't known yet.
+        """
+
+        by_id: dict[str, tuple[dict, bool]] = {}
+        by_key: dict[tuple[str, str], dict] = {}
+
+        with self._lock:
+            for batch in _batches([song.id for song in songs]):
+                placeholders = ", ".join(["?"] * len(batch))
+                for song_id, fields, has_key in self._connection.execute(
+                    f"SELECT id, fields, title_key IS NOT NULL FROM overrides WHERE id IN ({placeholders})",
+                    batch,
+                ):
+                    by_id[song_id] = json.loads(fields), bool(has_key)
+
+            unmatched = [song for song in songs if song.id not in by_id]
+            keys = {song.id: song_key(song) for song in songs if song.id not in by_id or not by_id[song.id][1]}
+
+            for batch in _batches(list({keys[song.id] for song in unmatched}), _QUERY_BATCH_SIZE // 2):
+                values = ", ".join(["(?, ?)"] * len(batch))
+                # the most recent override wins if several songs share the title and artist
+                for title_key, artist_key, fields in self._connection.execute(
+                    "SELECT title_key, artist_key, fields FROM overrides "
+                    f"WHERE (title_key, artist_key) IN (VALUES {values}) ORDER BY rowid",
+                    [part for key in batch for part in key],
+                ):
+                    by_key[title_key, artist_key] = {
+                        field: value for field, value in json.loads(fields).items() if field not in SONG_SPECIFIC_FIELDS
+                    }
+
+            learned = [(*keys[song_id], song_id) for song_id, (_, has_key) in by_id.items() if not has_key]
+            if learned:
+                with self._connection:
+                    self._connection.executemany(
+                        "UPDATE overrides SET title_key = ?, artist_key = ? WHERE id = ?", learned
+                    )
+
+        return [by_id[song.id][0] if song.id in by_id else by_key.get(keys[song.id]) for song in songs]
+
+    def apply(self, songs: Iterable[Song]) -> list[Song]:
+        """The songs with their overrides applied"""
+
+        songs = list(songs)
+        return [
+            song.with_overrides(fields) if fields else song
+            for song, fields in zip(songs, self.find(songs), strict=True)
+        ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Import or export the song overrides of the override store")
+    parser.add_argument("command", choices=["import", "export"])
+    parser.add_argument("file", type=Path, nargs="?", default=OVERRIDES_JSON_PATH, help="JSON file of the overrides")
+    args = parser.parse_args()
+
+    with OverrideStore() as store:
+        if args.command == "import":
+            count = store.import_json(args.file)
+            print(f"Imported {count} overrides from {args.file} into {store.path}, {len(store)} in total")
+        else:
+            count = store.export_json(args.file)
+            print(f"Exported {count} overrides from {store.path} to {args.file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Scheduler running the build stages concurrently as soon as their inputs are available."""
+
+import cProfile
+import time
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from generator.logger import item
+
+
+@dataclass(frozen=True)
+class Stage:
+    """A build stage with the named artifacts it reads and produces
+
+    Inputs that no stage produces are considered to be available from the start.
+    """
+
+    name: str
+    run: Callable[[], None]
+    inputs: frozenset[str] = field(default_factory=frozenset)
+    outputs: frozenset[str] = field(default_factory=frozenset)
+
+
+@dataclass
+class StageTiming:
+    start: float
+    end: float
+    # the dependency that finished last, i.e. the one this stage waited for
+    waited_for: str | None
+    # of the stage thread, the work of the render worker processes is measured separately
+    cpu_time: float = 0.0
+
+    @property
+    def duration(self) -> float:
+        return self.end - self.start
+
+
+class StageScheduler:
+    """Runs stages in threads as soon as all stages producing their inputs are done
+
+    Stages only coordinate the work, the CPU heavy parts run on the shared render process pool, so concurrent stages
+    share its worker budget.
+    """
+
+    def __init__(self, stages: list[Stage], profile_stage: str | None = None, profile_dir: Path = Path("generated")):
+        self.stages = {stage.name: stage for stage in stages}
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir
+        self.timings: dict[str, StageTiming] = {}
+
+        producers: dict[str, str] = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"Artifact {output} is produced by {producers[output]} and {stage.name}")
+                producers[output] = stage.name
+
+        self.dependencies = {
+            stage.name: {producers[name] for name in stage.inputs if name in producers} for stage in stages
+        }
+        self._check_acyclic()
+
+    def _check_acyclic(self) -> None:
+        visited: set[str] = set()
+        visiting: set[str] = set()
+
+        def visit(name: str) -> None:
+            if name in visiting:
+                raise ValueError(f"Stage {name} depends on itself")
+            if name in visited:
+                return
+            visiting.add(name)
+            for dependency in self.dependencies[name]:
+                visit(dependency)
+            visiting.remove(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self) -> None:
+        """Run all stages, raising the first error after the running stages finished"""
+
+        start_time = time.time()
+        pending = dict(self.dependencies)
+        running: dict[Future, str] = {}
+        done: set[str] = set()
+
+        with ThreadPoolExecutor(max_workers=len(self.stages) or 1, thread_name_prefix="stage") as executor:
+            while pending or running:
+                for name in [name for name, dependencies in pending.items() if dependencies <= done]:
+                    del pending[name]
+                    waited_for = max(self.dependencies[name], key=lambda dep: self.timings[dep].end, default=None)
+                    self.timings[name] = StageTiming(start=time.time(), end=0.0, waited_for=waited_for)
+                    running[executor.submit(self._run_stage, name)] = name
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    self.timings[name].end = time.time()
+                    if future.exception() is not None:
+                        # don't start any further stages, let the running ones finish and fail
+                        pending.clear()
+                        wait(running)
+                        raise future.exception()
+                    done.add(name)
+
+        self.total_time = time.time() - start_time
+
+    def _run_stage(self, name: str) -> None:
+        """Run a stage measuring its CPU time, and with cProfile if it is the stage to profile"""
+
+        profiler = cProfile.Profile() if name == self.profile_stage else None
+        cpu_start = time.thread_time()
+        try:
+            if profiler:
+                profiler.runcall(self.stages[name].run)
+            else:
+                self.stages[name].run()
+        finally:
+            self.timings[name].cpu_time = time.thread_time() - cpu_start
+            if profiler:
+                profile_path = self.profile_dir / f"profile-{name}.prof"
+                profiler.dump_stats(profile_path)
+                item(f"Profile of stage {name} saved to {profile_path}, view it with python -m pstats")
+
+    def critical_path(self) -> list[str]:
+        """The chain of stages that determined the total build time, in execution order"""
+
+        if not self.timings:
+            return []
+
+        path = [max(self.timings, key=lambda name: self.timings[name].end)]
+        while (waited_for := self.timings[path[-1]].waited_for) is not None:
+            path.append(waited_for)
+        return path[::-1]
+
+    def report(self) -> None:
+        """Log the duration of every stage and the critical path"""
+
+        for name, timing in sorted(self.timings.items(), key=lambda entry: entry[1].start):
+            item(f"{name}: {timing.duration:.1f}s (CPU {timing.cpu_time:.1f}s)")
+
+        path = self.critical_path()
+        path_time = sum(self.timings[name].duration for name in path)
+        item(
+            f"Critical path: {' → '.join(f'{name} ({self.timings[name].duration:.1f}s)' for name in path)}"
+            f" = {path_time:.1f}s of {self.total_time:.1f}s total"
+        )
@@ -1,4 +1,22 @@
-from generator.render.qr import generate_qr_codes
-from generator.render.typst import generate_cards_pdf, generate_year_distribution
+import importlib
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from generator.render.qr import generate_qr_codes
+    from generator.render.typst import generate_cards_pdf, generate_year_distribution
+
+# the stages are imported on first access, so the render workers importing a single stage don't load all of them
+_EXPORTS = {
+    "generate_cards_pdf": "generator.render.typst",
+    "generate_qr_codes": "generator.render.qr",
+    "generate_year_distribution": "generator.render.typst",
+}
+
+
+def __getattr__(name: str) -> object:
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(_EXPORTS[name]), name)
+
 
 __all__ = ["generate_cards_pdf", "generate_qr_codes", "generate_year_distribution"]
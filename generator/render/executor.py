@@ -0,0 +1,233 @@
+"""Process pool shared by the rendering stages, sending work to the workers in chunks."""
+
+import importlib
+import itertools
+import math
+import multiprocessing
+import threading
+import time
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, NamedTuple
+
+from generator.logger import progress_bar
+from generator.metrics import metrics, peak_rss_mb
+from generator.render.qr_raster import decode_embedded_image
+from generator.utils import get_max_workers
+
+# imported by every worker once on startup instead of with the first task
+WARM_UP_MODULES = ("generator.render.images", "generator.render.qr", "generator.render.qr_raster")
+
+# more chunks than workers keep all workers busy when chunks take different amounts of time
+CHUNKS_PER_WORKER = 4
+
+# chunk size for payloads that arrive over time and can't be split up by their total count
+STREAM_CHUNK_SIZE = 16
+
+PROGRESS_INTERVAL = 0.1
+
+Payload = tuple
+Task = Callable[..., Any]
+
+
+def _warm_up_worker(modules: tuple[str, ...], images: tuple[str, ...]) -> None:
+    for module in modules:
+        importlib.import_module(module)
+    # cached per process, so the tasks embedding them don't decode them
+    for image in images:
+        decode_embedded_image(Path(image))
+
+
+class _ChunkResult(NamedTuple):
+    results: list[tuple[Any, str | None]]
+    started_at: float
+    durations: list[float]
+    cpu_time: float
+    peak_rss_mb: float
+
+
+def _run_chunk(task: Task, context: Any, payloads: Sequence[Payload]) -> _ChunkResult:
+    """Run a task for every payload of a chunk, errors of single payloads don't fail the whole chunk
+
+    Also measures when the chunk was started, how long every payload took and the peak memory of the worker, for the
+    build metrics.
+    """
+
+    started_at = time.time()
+    cpu_start = time.process_time()
+    results: list[tuple[Any, str | None]] = []
+    durations: list[float] = []
+    for payload in payloads:
+        start = time.perf_counter()
+        try:
+            results.append((task(context, *payload), None))
+        except Exception as e:
+            results.append((None, str(e)))
+        durations.append(time.perf_counter() - start)
+    return _ChunkResult(results, started_at, durations, time.process_time() - cpu_start, peak_rss_mb())
+
+
+class _ActiveProgress:
+    """The progress bar that currently owns the terminal line, changed under _progress_lock"""
+
+    owner: "_ThrottledProgress | None" = None
+
+
+_progress_lock = threading.Lock()
+_active_progress = _ActiveProgress()
+
+
+class _ThrottledProgress:
+    """Progress bar that redraws at most every PROGRESS_INTERVAL seconds and always on completion
+
+    While open ended, the total still grows and catching up with it doesn't complete the progress bar. When stages run
+    concurrently, only the first progress bar is drawn until it completes, as they would overwrite each other's line.
+    """
+
+    def __init__(self, total: int, prefix: str, open_ended: bool = False):
+        self.total = total
+        self.prefix = prefix
+        self.open_ended = open_ended
+        self.completed = 0
+        self.start_time = time.time()
+        self._last_update = 0.0
+
+    def advance(self, count: int = 1) -> None:
+        self.completed += count
+        self.redraw()
+
+    def redraw(self) -> None:
+        is_complete = self.completed == self.total
+        if is_complete and self.open_ended:
+            return
+
+        now = time.time()
+        if not is_complete and now - self._last_update < PROGRESS_INTERVAL:
+            return
+
+        with _progress_lock:
+            if _active_progress.owner not in (None, self):
+                return
+            _active_progress.owner = None if is_complete else self
+
+            self._last_update = now
+            progress_bar(self.completed, self.total, indent=4, prefix=self.prefix, start_time=self.start_time)
+
+
+class RenderExecutor:
+    """Process pool for CPU bound rendering work that can be reused across stages
+
+    The pool is started on first use. Tasks are called as task(context, *payload) in the workers, the context is shared by
+    all payloads of a chunk, so payloads should only contain the compact per item data as primitive values.
+    """
+
+    def __init__(self, max_workers: int | None = None):
+        self.max_workers = max_workers or get_max_workers()
+        self._pool: ProcessPoolExecutor | None = None
+        self._warm_up_images: list[str] = []
+        # stages running concurrently share the pool
+        self._pool_lock = threading.Lock()
+
+    def __enter__(self) -> "RenderExecutor":
+        return self
+
+    def __exit__(self, *_) -> None:
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes"""
+
+        if self._pool:
+            self._pool.shutdown()
+            self._pool = None
+
+    def warm_up_images(self, image_paths: Iterable[Path]) -> None:
+        """Decode the embedded images in every worker on startup, only affects workers that aren't started yet"""
+
+        with self._pool_lock:
+            self._warm_up_images.extend(str(path) for path in image_paths if str(path) not in self._warm_up_images)
+
+    def workers_for(self, task_count: int) -> int:
+        """Number of workers that are used for the given number of tasks"""
+        return max(1, min(self.max_workers, task_count))
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # Typst's thread pool doesn't survive a fork, so workers forked after a compile in this process would
+                # hang, they are started from a clean fork server process instead. It is started with the first pool, so
+                # the workers see the environment variables as they were at that time.
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("forkserver"),
+                    initializer=_warm_up_worker,
+                    initargs=(WARM_UP_MODULES, tuple(self._warm_up_images)),
+                )
+            return self._pool
+
+    def map(
+        self,
+        task: Task,
+        context: Any,
+        payloads: Iterable[Payload],
+        prefix: str = "Progress",
+    ) -> Iterator[tuple[Payload, Any, str | None]]:
+        """Run a task for all payloads and yield (payload, result, error) in the order the chunks complete
+
+        Payloads may be a lazy iterable, e.g. songs that are still being downloaded. Its chunks are submitted as soon as
+        they are full and finished chunks are yielded while waiting for more payloads.
+        """
+
+        is_stream = not isinstance(payloads, Sequence)
+        if is_stream:
+            chunk_size = STREAM_CHUNK_SIZE
+            progress = _ThrottledProgress(0, prefix, open_ended=True)
+        else:
+            if not payloads:
+                return
+            chunk_size = math.ceil(len(payloads) / (self.workers_for(len(payloads)) * CHUNKS_PER_WORKER))
+            progress = _ThrottledProgress(len(payloads), prefix)
+
+        pool = self._get_pool()
+        futures: dict[Future, tuple[Sequence[Payload], float]] = {}
+
+        def drain(futures_done: Iterable[Future]) -> Iterator[tuple[Payload, Any, str | None]]:
+            for future in futures_done:
+                chunk, submitted_at = futures.pop(future)
+                chunk_result: _ChunkResult = future.result()
+
+                # payloads wait for the chunk to start and for the payloads before them
+                waited = chunk_result.started_at - submitted_at
+                queued = [waited + before for before in itertools.accumulate(chunk_result.durations[:-1], initial=0)]
+                metrics.record_tasks(prefix, queued, chunk_result.durations, chunk_result.cpu_time)
+                metrics.record_worker_memory(chunk_result.peak_rss_mb)
+
+                for payload, (result, error) in zip(chunk, chunk_result.results, strict=True):
+                    progress.advance()
+                    yield payload, result, error
+
+        for chunk in itertools.batched(payloads, chunk_size):
+            futures[pool.submit(_run_chunk, task, context, chunk)] = (chunk, time.time())
+            if is_stream:
+                progress.total += len(chunk)
+                yield from drain([future for future in futures if future.done()])
+
+        if is_stream:
+            progress.open_ended = False
+            progress.redraw()
+
+        yield from drain(as_completed(list(futures)))
+
+
+@contextmanager
+def use_executor(executor: RenderExecutor | None) -> Iterator[RenderExecutor]:
+    """Use the given shared executor, or a temporary one that is shut down afterwards"""
+
+    if executor:
+        yield executor
+        return
+
+    with RenderExecutor() as temporary_executor:
+        yield temporary_executor
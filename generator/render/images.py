@@ -1,69 +1,169 @@
 import io
+import shutil
 import sys
 import xml.etree.ElementTree as ET
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import cache
 from pathlib import Path
-from time import time
 
-import cairosvg
 from PIL import Image
 
-from generator.logger import item, progress_bar
-from generator.themes import Theme, get_card_colors, get_image_paths
-from generator.utils import calculate_relative_luminance, get_max_workers
+from generator.cache import AssetCache
+from generator.logger import item
+from generator.manifest import BuildManifest, hash_file, hash_inputs
+from generator.render.executor import RenderExecutor, use_executor
+from generator.themes import Theme, get_card_colors, get_decoration_print_height_cm, get_image_paths
+from generator.utils import calculate_relative_luminance, cm_to_pixels, get_print_dpi
 
+IMAGES_STAGE = "images"
 
-def generate_decoration_images(theme: Theme) -> None:
+# bump when the processing changes to invalidate the persistent image cache
+PROCESSED_IMAGE_VERSION = 1
+
+
+def generate_decoration_images(
+    theme: Theme,
+    manifest: BuildManifest | None = None,
+    executor: RenderExecutor | None = None,
+) -> None:
     """Generate decoration images for the songs and save them to the generated/decoration-images directory"""
 
+    manifest = manifest or BuildManifest(enabled=False)
+
     image_paths = get_image_paths(theme, purpose="decoration")
     colors = get_card_colors(theme)
 
     if not image_paths:
         return
 
-    max_workers = get_max_workers(min_workers=len(image_paths))
-    qr_args = [(image_path, color) for image_path in image_paths for color in colors]
+    output_height = cm_to_pixels(get_decoration_print_height_cm(theme), get_print_dpi())
+
+    qr_args = [
+        (str(image_path), color)
+        for image_path in image_paths
+        for color in colors
+        if not is_processed_image_fresh(manifest, image_path, color, output_height=output_height)
+    ]
+
+    if not qr_args:
+        item(f"All {len(image_paths) * len(colors)} decoration images are up to date")
+        return
 
-    completed_count = 0
     total_images = len(qr_args)
     errors = []
-    start_time = time()
-
-    item(f"Generating {len(image_paths)} embedded QR code images using {max_workers} parallel workers")
-
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_image_path = {executor.submit(process_embedded_image, *args): args for args in qr_args}
-        for future in as_completed(future_to_image_path):
-            try:
-                future.result()
-                completed_count += 1
-                progress_bar(completed_count, total_images, indent=4, prefix="Images", start_time=start_time)
-            except Exception as e:
-                image_path = future_to_image_path[future]
-                error_msg = f"Error processing image {image_path}: {e}"
+
+    with use_executor(executor) as pool:
+        item(
+            f"Generating {len(image_paths)} embedded QR code images using "
+            f"{pool.workers_for(total_images)} parallel workers"
+        )
+
+        for (image_path, color), _, error in pool.map(
+            _process_decoration_image, output_height, qr_args, prefix="Images"
+        ):
+            if error:
+                manifest.save()
+                error_msg = f"Error processing image {image_path}: {error}"
                 item(error_msg)
                 errors.append(error_msg)
-                progress_bar(completed_count, total_images, indent=4, prefix="Images", start_time=start_time)
                 sys.exit(1)
 
+            record_processed_image(manifest, Path(image_path), color, output_height=output_height)
+
+    manifest.save()
+    evict_image_cache()
+
     if errors:
         item(f"Completed with {len(errors)} errors out of {total_images} images")
     else:
         item(f"Successfully generated all {total_images} embedded QR code images")
 
 
+def _process_decoration_image(output_height: int, image_path: str, background_color: tuple[int, int, int]) -> None:
+    """Worker task processing a single decoration image"""
+    process_embedded_image(Path(image_path), background_color, output_height=output_height)
+
+
+@cache
+def _image_cache() -> AssetCache:
+    return AssetCache("images", suffix=".png")
+
+
+def evict_image_cache() -> None:
+    """Shrink the persistent image cache to its size limit"""
+    _image_cache().evict()
+
+
+def get_processed_image_path(image_path: Path, background_color: tuple[int, int, int], outline=False) -> Path:
+    """Get the path of the processed PNG version of an embedded SVG image"""
+    return (
+        Path("generated/images")
+        / f"{image_path.stem}_{background_color[0]}_{background_color[1]}_{background_color[2]}{'_outline' if outline else ''}.png"
+    )
+
+
+def _processed_image_digest(
+    image_path: Path,
+    background_color: tuple[int, int, int],
+    fill_color: tuple[int, int, int] | None,
+    outline: bool,
+    output_width: int | None,
+    output_height: int | None,
+) -> str:
+    return hash_inputs(hash_file(image_path), background_color, fill_color, outline, output_width, output_height)
+
+
+def is_processed_image_fresh(
+    manifest: BuildManifest,
+    image_path: Path,
+    background_color: tuple[int, int, int],
+    fill_color: tuple[int, int, int] | None = None,
+    outline=False,
+    output_width: int | None = None,
+    output_height: int | None = None,
+) -> bool:
+    """Check whether the processed image is up to date, removing an outdated one so that it gets regenerated"""
+
+    processed_path = get_processed_image_path(image_path, background_color, outline)
+    digest = _processed_image_digest(image_path, background_color, fill_color, outline, output_width, output_height)
+    if manifest.is_fresh(IMAGES_STAGE, processed_path.name, digest, processed_path):
+        return True
+
+    manifest.forget(IMAGES_STAGE, processed_path.name)
+    processed_path.unlink(missing_ok=True)
+    return False
+
+
+def record_processed_image(
+    manifest: BuildManifest,
+    image_path: Path,
+    background_color: tuple[int, int, int],
+    fill_color: tuple[int, int, int] | None = None,
+    outline=False,
+    output_width: int | None = None,
+    output_height: int | None = None,
+) -> None:
+    """Record the inputs of a successfully processed image in the build manifest"""
+
+    processed_path = get_processed_image_path(image_path, background_color, outline)
+    digest = _processed_image_digest(image_path, background_color, fill_color, outline, output_width, output_height)
+    manifest.record(IMAGES_STAGE, processed_path.name, digest)
+
+
 def process_embedded_image(
     image_path: Path,
     background_color: tuple[int, int, int],
     fill_color: tuple[int, int, int] | None = None,
     outline=False,
+    output_width: int | None = None,
+    output_height: int | None = None,
 ) -> Path:
     """Process an embedded SVG image to tint it with a variation of the background color and add an outline
 
     Args:
         image_path: Path to the original SVG image
         background_color: RGB tuple of the background color
+        output_width: Width of the PNG in pixels, derived from the height or the SVG size if not set
+        output_height: Height of the PNG in pixels, derived from the width or the SVG size if not set
 
     Returns:
         Path to the processed PNG image file
@@ -73,15 +173,20 @@ def process_embedded_image(
 
     Path("generated/images").mkdir(parents=True, exist_ok=True)
 
-    processed_path = (
-        Path("generated/images")
-        / f"{image_path.stem}_{background_color[0]}_{background_color[1]}_{background_color[2]}{'_outline' if outline else ''}.png"
-    )
+    processed_path = get_processed_image_path(image_path, background_color, outline)
     if processed_path.exists():
         return processed_path
 
     try:
-        svg_content = image_path.read_text(encoding="utf-8")
+        svg_content = image_path.read_bytes()
+
+        cache_key = AssetCache.key(
+            PROCESSED_IMAGE_VERSION, svg_content, background_color, fill_color, outline, output_width, output_height
+        )
+        if cached_path := _image_cache().get(cache_key):
+            shutil.copyfile(cached_path, processed_path)
+            return processed_path
+
         root = ET.fromstring(svg_content)
 
         # Find and modify the fill color in the SVG
@@ -131,12 +236,23 @@ def process_embedded_image(
                     for i, stroke_path in enumerate(stroke_paths):
                         main_group.insert(i, stroke_path)
 
+        # only needed on a cache miss, workers rendering QR codes from cached images never load cairo
+        import cairosvg  # noqa: PLC0415
+
         modified_svg = ET.tostring(root, encoding="unicode")
-        png_data = cairosvg.svg2png(bytestring=modified_svg.encode("utf-8"))
+        png_data = cairosvg.svg2png(
+            bytestring=modified_svg.encode("utf-8"),
+            output_width=output_width,
+            output_height=output_height,
+        )
 
         with Image.open(io.BytesIO(png_data)) as original_img:
             img_rgba = original_img.convert("RGBA") if original_img.mode != "RGBA" else original_img
-            img_rgba.save(processed_path, "PNG")
+            processed_png = io.BytesIO()
+            img_rgba.save(processed_png, "PNG")
+
+        processed_path.write_bytes(processed_png.getvalue())
+        _image_cache().put(cache_key, processed_png.getvalue())
 
         return processed_path
 
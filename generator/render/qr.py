@@ -1,7 +1,10 @@
-import time
-from collections.abc import Iterator
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import itertools
+import json
+import math
+from collections.abc import Iterable, Iterator, Sequence
+from enum import StrEnum
 from pathlib import Path
+from typing import NamedTuple
 
 import qrcode
 import qrcode.constants
@@ -10,105 +13,263 @@ from qrcode.image.styles.colormasks import SolidFillColorMask
 from qrcode.image.styles.moduledrawers.pil import CircleModuleDrawer
 
 from generator.connectors import Song
-from generator.logger import item, progress_bar
-from generator.render.images import process_embedded_image
-from generator.themes import Theme, get_image_paths, get_qr_background_color, get_qr_fill_color, get_qr_image_color
-from generator.utils import get_max_workers
+from generator.logger import item
+from generator.manifest import BuildManifest, hash_file, hash_inputs
+from generator.render.executor import RenderExecutor, use_executor
+from generator.render.images import (
+    evict_image_cache,
+    is_processed_image_fresh,
+    process_embedded_image,
+    record_processed_image,
+)
+from generator.render.qr_raster import decode_embedded_image, embedded_image_geometry, render_qr_code
+from generator.render.qr_vector import render_qr_code_svg
+from generator.themes import (
+    Theme,
+    get_image_paths,
+    get_qr_background_color,
+    get_qr_fill_color,
+    get_qr_image_color,
+    get_qr_print_size_cm,
+)
+from generator.utils import cm_to_pixels, get_env_var, get_print_dpi
 
+QR_CODES_STAGE = "qr-codes"
 
-def _qr_code_image_generator(theme: Theme) -> Iterator[Path]:
-    """Generator that yields available images for the given theme in a cycling pattern"""
+QR_EMBEDDED_IMAGE_RATIO = 0.5
 
-    image_paths = get_image_paths(theme, purpose="qr")
+# bump when the rendering changes to invalidate the QR codes of incremental builds
+QR_CODE_VERSION = 2
 
-    background_color = get_qr_background_color(theme)
-    image_color = get_qr_image_color(theme)
 
-    index = 0
-    while True:
-        if image_paths:
-            base_image = image_paths[index % len(image_paths)]
-            yield process_embedded_image(base_image, background_color, fill_color=image_color, outline=True)
-        else:
-            yield None
-        index += 1
+class QRRenderer(StrEnum):
+    STYLED = "styled"  # qrcode's StyledPilImage, draws every module with PIL
+    NUMPY = "numpy"  # stamps a precomputed module sprite, pixel-equivalent to styled
 
 
-def _generate_qr_code(
-    song: Song,
-    theme: Theme,
-    image_path: Path,
-    output_dir: str,
-) -> None:
-    """Generate a single QR code for a song - designed for parallel execution"""
+class QRFormat(StrEnum):
+    PNG = "png"
+    SVG = "svg"  # vector modules, the themes place the embedded image on top
+
 
-    qr = qrcode.QRCode(
-        box_size=12,
+def get_qr_format() -> QRFormat:
+    """Get the configured output format of the QR codes"""
+    return QRFormat(get_env_var("QR_FORMAT", QRFormat.PNG))
+
+
+def _new_qr_code() -> qrcode.QRCode:
+    return qrcode.QRCode(
         border=0,
         error_correction=qrcode.constants.ERROR_CORRECT_H,
         image_factory=qrcode.image.styledpil.StyledPilImage,
         mask_pattern=None,
     )
 
+
+def _box_size(modules_count: int, size: int) -> int:
+    """Smallest module size in pixels for a QR code of at least the given size"""
+    return max(1, math.ceil(size / modules_count))
+
+
+def _qr_code_size(theme: Theme) -> int:
+    """Minimum size of the QR codes of the theme in pixels"""
+    return cm_to_pixels(get_qr_print_size_cm(theme), get_print_dpi())
+
+
+def prepare_embedded_images(theme: Theme, manifest: BuildManifest | None = None) -> list[Path]:
+    """Process the images embedded into the QR codes of the theme, returns the processed images in cycling order"""
+
+    manifest = manifest or BuildManifest(enabled=False)
+
+    options = {
+        "fill_color": get_qr_image_color(theme),
+        "outline": True,
+        "output_width": math.ceil(_qr_code_size(theme) * QR_EMBEDDED_IMAGE_RATIO),
+    }
+    background_color = get_qr_background_color(theme)
+
+    processed_paths = []
+    for image_path in get_image_paths(theme, purpose="qr"):
+        # checked first, an outdated processed image is removed so that it gets processed again
+        is_fresh = is_processed_image_fresh(manifest, image_path, background_color, **options)
+        processed_paths.append(process_embedded_image(image_path, background_color, **options))
+        if not is_fresh:
+            record_processed_image(manifest, image_path, background_color, **options)
+    evict_image_cache()
+
+    return processed_paths
+
+
+def _qr_code_image_generator(theme: Theme, manifest: BuildManifest) -> Iterator[Path | None]:
+    """Generator that yields available images for the given theme in a cycling pattern"""
+
+    image_paths = prepare_embedded_images(theme, manifest)
+    if not image_paths:
+        yield from itertools.repeat(None)
+    yield from itertools.cycle(image_paths)
+
+
+def _qr_code_digest(song: Song, theme: Theme, image_path: Path | None, qr_format: QRFormat, size: int) -> str:
+    """Hash of all inputs that affect the QR code image of a song"""
+    return hash_inputs(
+        QR_CODE_VERSION, song.qr_code_value, theme, hash_file(image_path) if image_path else None, qr_format, size
+    )
+
+
+def _embedded_image_placement(song: Song, image_path: Path, size: int) -> dict:
+    """Position and size of the embedded image relative to the QR code size, for themes using SVG QR codes"""
+
+    qr = _new_qr_code()
     qr.add_data(song.qr_code_value)
+    modules_count = qr.best_fit() * 4 + 17
+
+    box_size = _box_size(modules_count, size)
+    total_width = modules_count * box_size
+    offset, width = embedded_image_geometry(total_width, box_size, QR_EMBEDDED_IMAGE_RATIO)
+    return {"image": image_path.name, "offset": offset / total_width, "size": width / total_width}
+
+
+class _QRCodeContext(NamedTuple):
+    """Settings shared by all QR codes of a build, sent to the workers once per chunk"""
+
+    back_color: tuple[int, int, int]
+    front_color: tuple[int, int, int]
+    output_dir: str
+    renderer: str
+    qr_format: str
+    size: int
+
+
+def _generate_qr_code(
+    context: _QRCodeContext,
+    song_id: str,
+    qr_code_value: str,
+    image_path: str | None,
+) -> None:
+    """Generate a single QR code for a song - designed for parallel execution"""
+
+    qr = _new_qr_code()
+    qr.add_data(qr_code_value)
     qr.make(fit=True)
+    qr.box_size = _box_size(qr.modules_count, context.size)
 
-    qr_image = qr.make_image(
-        embeded_image_path=str(image_path.absolute()) if image_path else None,
-        embeded_image_ratio=0.5,
-        module_drawer=CircleModuleDrawer(),
-        color_mask=SolidFillColorMask(
-            back_color=get_qr_background_color(theme),
-            front_color=get_qr_fill_color(theme),
-        ),
-    )
+    if context.qr_format == QRFormat.SVG:
+        svg = render_qr_code_svg(qr.get_matrix(), back_color=context.back_color, front_color=context.front_color)
+        Path(f"{context.output_dir}/{song_id}.svg").write_text(svg, encoding="utf-8")
+        return
+
+    if context.renderer == QRRenderer.NUMPY:
+        qr_image = render_qr_code(
+            qr.get_matrix(),
+            box_size=qr.box_size,
+            back_color=context.back_color,
+            front_color=context.front_color,
+            embedded_image_path=Path(image_path) if image_path else None,
+            embedded_image_ratio=QR_EMBEDDED_IMAGE_RATIO,
+        )
+    else:
+        qr_image = qr.make_image(
+            embeded_image=decode_embedded_image(Path(image_path)) if image_path else None,
+            embeded_image_ratio=QR_EMBEDDED_IMAGE_RATIO,
+            module_drawer=CircleModuleDrawer(),
+            color_mask=SolidFillColorMask(back_color=context.back_color, front_color=context.front_color),
+        )
 
     qr_image.save(
-        f"{output_dir}/{song.id}.png",
+        f"{context.output_dir}/{song_id}.png",
         format="PNG",
         compress_level=0,
     )
 
 
-def generate_qr_codes(theme: Theme, songs: list[Song]) -> None:
-    """Generate QR codes for the songs and save them to the generated/qr-codes directory"""
+def generate_qr_codes(
+    theme: Theme,
+    songs: Iterable[Song],
+    manifest: BuildManifest | None = None,
+    executor: RenderExecutor | None = None,
+    output_dir: Path = Path("generated/qr-codes"),
+) -> None:
+    """Generate QR codes for the songs and save them to the output directory
 
-    if not songs:
-        item("No songs to process")
-        return
+    The songs may also be a lazy iterable, e.g. while the playlist is still being fetched. Rendering then starts with the
+    first songs and overlaps with the download of the remaining ones.
+    """
+
+    manifest = manifest or BuildManifest(enabled=False)
 
-    Path("generated/qr-codes").mkdir(parents=True, exist_ok=True)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    size = _qr_code_size(theme)
+    image_generator = _qr_code_image_generator(theme, manifest)
+    qr_format = get_qr_format()
+    context = _QRCodeContext(
+        back_color=get_qr_background_color(theme),
+        front_color=get_qr_fill_color(theme),
+        output_dir=str(output_dir),
+        renderer=str(QRRenderer(get_env_var("QR_RENDERER", QRRenderer.STYLED))),
+        qr_format=str(qr_format),
+        size=size,
+    )
 
-    output_dir = "generated/qr-codes"
+    song_ids: list[str] = []
+    digests: dict[str, str] = {}
+    placements: dict[str, dict] = {}
 
-    image_generator = _qr_code_image_generator(theme)
+    def outdated_qr_args() -> Iterator[tuple[str, str, str | None]]:
+        for song in songs:
+            song_ids.append(song.id)
 
-    max_workers = get_max_workers(min_workers=len(songs))
-    qr_args = [(song, theme, next(image_generator), output_dir) for song in songs]
+            image_path = next(image_generator)
+            if qr_format == QRFormat.SVG and image_path:
+                placements[song.id] = _embedded_image_placement(song, image_path, size)
 
-    item(f"Generating {len(songs)} QR codes using {max_workers} parallel workers")
+            digests[song.id] = _qr_code_digest(song, theme, image_path, qr_format, size)
+            if manifest.is_fresh(
+                QR_CODES_STAGE, song.id, digests[song.id], Path(f"{output_dir}/{song.id}.{qr_format}")
+            ):
+                continue
+            manifest.forget(QR_CODES_STAGE, song.id)
+            yield (song.id, song.qr_code_value, str(image_path) if image_path else None)
 
-    completed_count = 0
-    total_songs = len(qr_args)
+    total_songs = 0
     errors = []
-    start_time = time.time()
-
-    with ProcessPoolExecutor(max_workers=max_workers) as executor:
-        future_to_song = {executor.submit(_generate_qr_code, *args): args[0] for args in qr_args}
-        for future in as_completed(future_to_song):
-            try:
-                future.result()
-                completed_count += 1
-                progress_bar(completed_count, total_songs, indent=4, prefix="QR Codes", start_time=start_time)
-
-            except Exception as e:
-                song = future_to_song[future]
-                error_msg = f"Error generating QR code for song {song.id}: {e}"
+
+    with use_executor(executor) as pool:
+        if isinstance(songs, Sequence):
+            qr_args = list(outdated_qr_args())
+            if qr_args:
+                item(f"Generating {len(qr_args)} QR codes using {pool.workers_for(len(qr_args))} parallel workers")
+        else:
+            qr_args = outdated_qr_args()
+            item(f"Generating QR codes while fetching songs using {pool.max_workers} parallel workers")
+
+        for (song_id, _, _), _, error in pool.map(_generate_qr_code, context, qr_args, prefix="QR Codes"):
+            total_songs += 1
+            if error:
+                error_msg = f"Error generating QR code for song {song_id}: {error}"
                 item(error_msg)
                 errors.append(error_msg)
-                progress_bar(completed_count, total_songs, indent=4, prefix="QR Codes", start_time=start_time)
+            else:
+                manifest.record(QR_CODES_STAGE, song_id, digests[song_id])
+
+    if not song_ids:
+        item("No songs to process")
+        return
+
+    for song_id in manifest.prune(QR_CODES_STAGE, keep=song_ids):
+        for stale_format in QRFormat:
+            Path(f"{output_dir}/{song_id}.{stale_format}").unlink(missing_ok=True)
+
+    if qr_format == QRFormat.SVG:
+        with Path(f"{output_dir}/embedded-images.json").open("w", encoding="utf-8") as file:
+            json.dump(placements, file, indent=4)
+
+    manifest.save()
+
+    if total_songs < len(song_ids):
+        item(f"Skipped {len(song_ids) - total_songs} unchanged QR codes")
 
     if errors:
         item(f"Completed with {len(errors)} errors out of {total_songs} songs")
-    else:
+    elif total_songs:
         item(f"Successfully generated all {total_songs} QR codes")
@@ -0,0 +1,142 @@
+"""NumPy based QR code raster engine.
+
+Produces the same pixels as qrcode's StyledPilImage with a CircleModuleDrawer and a SolidFillColorMask, but stamps
+precomputed module sprites onto the canvas instead of drawing and recoloring every module with PIL. Like qrcode, the
+modules of the three finder patterns (eyes) are drawn as squares.
+"""
+
+from functools import cache
+from pathlib import Path
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# same supersampling factor the qrcode CircleModuleDrawer uses
+ANTIALIASING_FACTOR = 4
+
+# width of the finder patterns in modules
+EYE_SIZE = 7
+
+Color = tuple[int, ...]
+
+
+def _interp_num(n1: int, n2: int, norm: float) -> int:
+    return int(n2 * norm + n1 * (1 - norm))
+
+
+def _mask_color(pixel: Color, back_color: Color, paint_color: Color, front_color: Color) -> Color:
+    """Recolor a single pixel exactly like qrcode's QRColorMask.apply_mask"""
+
+    # an RGBA pixel keeps its alpha, only the color channels are compared
+    channels = zip(back_color, paint_color, pixel[: len(back_color)], strict=True)
+    normed = [(ci - c1) / (c2 - c1) for c1, c2, ci in channels if c1 != c2]
+    if not normed:
+        return back_color
+
+    norm = sum(normed) / len(normed)
+    # antialiased pixels can extrapolate beyond the channel range, PIL clamps them when qrcode sets them
+    return tuple(max(0, min(255, _interp_num(back_color[i], front_color[i], norm))) for i in range(len(back_color)))
+
+
+@cache
+def _module_sprite(box_size: int, mode: str, back_color: Color, front_color: Color, square: bool = False) -> np.ndarray:
+    """Circle module, or square eye module, with the fill color applied, shaped (box_size, box_size, channels)"""
+
+    paint_color = tuple(0 for _ in back_color)
+
+    if square:
+        # like qrcode's SquareModuleDrawer, which draws the eyes
+        module = Image.new(mode, (box_size, box_size), back_color)
+        ImageDraw.Draw(module).rectangle((0, 0, box_size - 1, box_size - 1), fill=paint_color)
+    else:
+        fake_size = box_size * ANTIALIASING_FACTOR
+        module = Image.new(mode, (fake_size, fake_size), back_color)
+        ImageDraw.Draw(module).ellipse((0, 0, fake_size, fake_size), fill=paint_color)
+        module = module.resize((box_size, box_size), Image.Resampling.LANCZOS)
+
+    sprite = np.array(module)
+    if back_color == (255, 255, 255) and front_color == (0, 0, 0):
+        # the sprite is already drawn in black and white, the color mask is a no-op
+        return sprite
+
+    pixels = sprite.reshape(-1, sprite.shape[-1])
+    original = pixels.copy()
+    for pixel in np.unique(original, axis=0).tolist():
+        color = _mask_color(tuple(pixel), back_color, paint_color, front_color)
+        pixels[(original == pixel).all(axis=1), : len(color)] = color
+
+    return sprite
+
+
+@cache
+def decode_embedded_image(image_path: Path) -> Image.Image:
+    """Decode an embedded image once per process"""
+
+    with Image.open(image_path) as image:
+        image.load()
+        return image.copy()
+
+
+@cache
+def _resized_embedded_image(image_path: Path, width: int) -> Image.Image:
+    return decode_embedded_image(image_path).resize((width, width), Image.Resampling.LANCZOS)
+
+
+def eye_mask(size: int) -> np.ndarray:
+    """Modules of the three finder patterns, matching qrcode's BaseImage.is_eye for a QR code without border"""
+
+    mask = np.zeros((size, size), dtype=bool)
+    mask[:EYE_SIZE, :EYE_SIZE] = True
+    mask[:EYE_SIZE, -EYE_SIZE:] = True
+    mask[-EYE_SIZE:, :EYE_SIZE] = True
+    return mask
+
+
+def embedded_image_geometry(total_width: int, box_size: int, embedded_image_ratio: float) -> tuple[int, int]:
+    """Offset and width of the embedded image in pixels, aligned to the module grid like StyledPilImage does"""
+
+    logo_width_ish = int(total_width * embedded_image_ratio)
+    # round the offset to the nearest module
+    logo_offset = int((int(total_width / 2) - int(logo_width_ish / 2)) / box_size) * box_size
+    return logo_offset, total_width - logo_offset * 2
+
+
+def render_qr_code(
+    modules: list[list[bool]],
+    box_size: int,
+    back_color: tuple[int, int, int],
+    front_color: tuple[int, int, int],
+    embedded_image_path: Path | None = None,
+    embedded_image_ratio: float = 0.5,
+) -> Image.Image:
+    """Render a QR code module matrix with circle modules, square eyes and an optional centered embedded image"""
+
+    embedded_image = decode_embedded_image(embedded_image_path) if embedded_image_path else None
+    mode = "RGBA" if embedded_image and "A" in embedded_image.getbands() else "RGB"
+
+    sprite = _module_sprite(box_size, mode, back_color, front_color)
+    eye_sprite = _module_sprite(box_size, mode, back_color, front_color, square=True)
+    background = np.array(Image.new(mode, (1, 1), back_color))[0, 0]
+
+    active = np.asarray(modules, dtype=bool)
+    size = active.shape[0]
+    channels = sprite.shape[-1]
+
+    blocks = np.empty((size, size, box_size, box_size, channels), dtype=np.uint8)
+    blocks[...] = background
+    eyes = eye_mask(size)
+    blocks[active & ~eyes] = sprite
+    blocks[active & eyes] = eye_sprite
+    canvas = blocks.transpose(0, 2, 1, 3, 4).reshape(size * box_size, size * box_size, channels)
+
+    image = Image.fromarray(canvas)
+
+    if embedded_image:
+        logo_offset, logo_width = embedded_image_geometry(image.size[0], box_size, embedded_image_ratio)
+        region = _resized_embedded_image(embedded_image_path, logo_width)
+        if "A" in region.getbands():
+            image.alpha_composite(region, (logo_offset, logo_offset))
+        else:
+            image.paste(region, (logo_offset, logo_offset))
+
+    return image
@@ -0,0 +1,40 @@
+"""SVG QR code output with circle modules and square eyes, like the PNG QR codes.
+
+The embedded image is not part of the SVG, the Typst themes place the shared processed image on top of the QR code,
+so it is only embedded once into the final PDF.
+"""
+
+from generator.render.images import rgb_to_hex
+from generator.render.qr_raster import EYE_SIZE
+
+
+def _is_eye(x: int, y: int, size: int) -> bool:
+    """Whether the module is part of one of the three finder patterns"""
+    return (
+        (x < EYE_SIZE and y < EYE_SIZE)
+        or (x >= size - EYE_SIZE and y < EYE_SIZE)
+        or (x < EYE_SIZE and y >= size - EYE_SIZE)
+    )
+
+
+def render_qr_code_svg(
+    modules: list[list[bool]],
+    back_color: tuple[int, int, int],
+    front_color: tuple[int, int, int],
+) -> str:
+    """Render a QR code module matrix as SVG with one unit per module and all modules in a single path"""
+
+    size = len(modules)
+    path = "".join(
+        f"M{x} {y}h1v1h-1z" if _is_eye(x, y, size) else f"M{x} {y + 0.5}a.5 .5 0 1 0 1 0a.5 .5 0 1 0-1 0"
+        for y, row in enumerate(modules)
+        for x, is_active in enumerate(row)
+        if is_active
+    )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}">'
+        f'<rect width="{size}" height="{size}" fill="{rgb_to_hex(back_color)}"/>'
+        f'<path d="{path}" fill="{rgb_to_hex(front_color)}"/>'
+        "</svg>"
+    )
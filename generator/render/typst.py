@@ -1,71 +1,171 @@
+import json
+import math
+import shutil
+import threading
 from collections import Counter
+from pathlib import Path
+from typing import NamedTuple
 
-import matplotlib.pyplot as plt
 import typst
-from matplotlib.backends.backend_pdf import PdfPages
 
-from generator.connectors import Song
+from generator.connectors import Song, iter_songs_json
 from generator.logger import item
-from generator.utils import get_env_var
+from generator.manifest import BuildManifest, hash_file, hash_inputs
+from generator.render.executor import RenderExecutor, use_executor
+from generator.render.images import IMAGES_STAGE
+from generator.render.qr import QR_CODES_STAGE, get_qr_format
+from generator.themes import CARDS_PER_PAGE, Theme
+from generator.utils import get_font_paths, get_max_workers, get_typst_shard_cards
 
+CARDS_PDF_STAGE = "cards-pdf"
 
-def generate_cards_pdf(output_pdf: str) -> None:
-    """Generate a PDF of the cards"""
+SHARDS_DIR = Path("generated/shards")
+MERGE_TEMPLATE = Path("generator/themes/lib/merge.typ")
+YEAR_DISTRIBUTION_TEMPLATE = Path("generator/render/year-distribution.typ")
 
-    theme = get_env_var("THEME", "black-white")
+# warm compilers by template and font paths, a compiler is only used by the thread that created it
+_compilers = threading.local()
 
-    item(f"Compiling Typst theme [highlight]{theme}[/highlight]...")
-    typst.compile_with_warnings(
-        f"generator/themes/{theme}.typ",
-        output=output_pdf,
-        root=".",
-    )
 
+class _ShardContext(NamedTuple):
+    template: str
+    sys_inputs: dict[str, str]
 
-def generate_year_distribution(songs: list[Song], output_pdf: str, output_png: str) -> None:
-    """Generate both PDF and CLI PNG versions of the year distribution chart"""
 
-    if not songs:
-        item("No songs to analyze")
+def _get_compiler(template: str) -> typst.Compiler:
+    """Long-lived compiler of a template that loads the fonts once and reuses its caches across compilations"""
+
+    font_paths = get_font_paths()
+    compilers = _compilers.__dict__.setdefault("by_template", {})
+    key = (template, tuple(font_paths))
+    if key not in compilers:
+        compilers[key] = typst.Compiler(template, root=".", font_paths=font_paths)
+    return compilers[key]
+
+
+def _compile(template: str, output_pdf: str, sys_inputs: dict[str, str]) -> None:
+    _get_compiler(template).compile_with_warnings(output=output_pdf, sys_inputs=sys_inputs)
+
+
+def get_shard_ranges(song_count: int, workers: int) -> list[tuple[int, int]]:
+    """Split the songs into page aligned (start, end) ranges, at most one per worker
+
+    Every shard contains whole pages, so the front and back sides of a page always end up in the same shard.
+    """
+
+    min_shard_cards = math.ceil(get_typst_shard_cards() / CARDS_PER_PAGE) * CARDS_PER_PAGE
+    if song_count <= min_shard_cards or workers == 1:
+        return [(0, song_count)]
+
+    pages = math.ceil(song_count / CARDS_PER_PAGE)
+    shard_cards = max(min_shard_cards, math.ceil(pages / workers) * CARDS_PER_PAGE)
+    return [(start, min(start + shard_cards, song_count)) for start in range(0, song_count, shard_cards)]
+
+
+def _compile_shard(context: _ShardContext, start: int, end: int, output_pdf: str) -> int:
+    """Compile the cards of a song range and return the number of pages (front and back sides)"""
+
+    _compile(
+        context.template,
+        output_pdf,
+        {**context.sys_inputs, "shard-start": str(start), "shard-end": str(end)},
+    )
+    return math.ceil((end - start) / CARDS_PER_PAGE) * 2
+
+
+def _compile_sharded(
+    template: Path,
+    sys_inputs: dict[str, str],
+    shard_ranges: list[tuple[int, int]],
+    output_pdf: str,
+    executor: RenderExecutor | None,
+) -> None:
+    """Compile the shards in parallel and merge their pages in order into the output PDF"""
+
+    SHARDS_DIR.mkdir(parents=True, exist_ok=True)
+    shard_args = [(start, end, str(SHARDS_DIR / f"{index}.pdf")) for index, (start, end) in enumerate(shard_ranges)]
+    context = _ShardContext(template=str(template), sys_inputs=sys_inputs)
+
+    shard_pages: dict[str, int] = {}
+    with use_executor(executor) as pool:
+        for (_, _, shard_pdf), pages, error in pool.map(_compile_shard, context, shard_args, prefix="Shards"):
+            if error:
+                shutil.rmtree(SHARDS_DIR)
+                raise RuntimeError(f"Error compiling cards shard {shard_pdf}: {error}")
+            shard_pages[shard_pdf] = pages
+
+    item(f"Merging {len(shard_args)} shards...")
+    shards = [{"path": f"/{shard_pdf}", "pages": shard_pages[shard_pdf]} for _, _, shard_pdf in shard_args]
+    _compile(str(MERGE_TEMPLATE), output_pdf, {"shards": json.dumps(shards)})
+    shutil.rmtree(SHARDS_DIR)
+
+
+def generate_cards_pdf(
+    theme: Theme,
+    output_pdf: str,
+    songs: list[Song],
+    manifest: BuildManifest | None = None,
+    executor: RenderExecutor | None = None,
+    qr_codes_dir: Path = Path("generated/qr-codes"),
+) -> None:
+    """Generate a PDF of the cards, large decks are compiled in parallel shards that are merged afterwards
+
+    The songs are passed to Typst in memory, and the compilers are kept warm for recompiles, e.g. in watch mode.
+    """
+
+    manifest = manifest or BuildManifest(enabled=False)
+
+    template = Path(f"generator/themes/{theme}.typ")
+    sys_inputs = {
+        "qr-format": str(get_qr_format()),
+        # relative to the project root
+        "qr-dir": f"/{qr_codes_dir.as_posix()}",
+        "songs": "".join(iter_songs_json(songs)),
+    }
+
+    digest = hash_inputs(
+        hash_file(template),
+        *(hash_file(path) for path in sorted(Path("generator/themes/lib").glob("*.typ"))),
+        sys_inputs,
+        get_font_paths(),
+        manifest.stage_digest(QR_CODES_STAGE),
+        manifest.stage_digest(IMAGES_STAGE),
+    )
+    if manifest.is_fresh(CARDS_PDF_STAGE, output_pdf, digest, Path(output_pdf)):
+        item(f"Cards PDF for theme [highlight]{theme}[/highlight] is up to date")
         return
 
+    workers = executor.max_workers if executor else get_max_workers()
+    shard_ranges = get_shard_ranges(len(songs), workers)
+    if len(shard_ranges) == 1:
+        item(f"Compiling Typst theme [highlight]{theme}[/highlight]...")
+        _compile(str(template), output_pdf, sys_inputs)
+    else:
+        item(f"Compiling Typst theme [highlight]{theme}[/highlight] in {len(shard_ranges)} shards...")
+        _compile_sharded(template, sys_inputs, shard_ranges, output_pdf, executor)
+
+    manifest.record(CARDS_PDF_STAGE, output_pdf, digest)
+    manifest.save()
+
+
+def get_year_counts(songs: list[Song]) -> dict[int, int]:
+    """Number of songs per year, including the years without songs between the first and the last one"""
+
     year_counts = Counter(song.year for song in songs)
+    return {year: year_counts[year] for year in range(min(year_counts), max(year_counts) + 1)}
+
+
+def generate_year_distribution(songs: list[Song], output_pdf: str) -> dict[int, int]:
+    """Generate the PDF chart of the songs per year with Typst and return the counts for the terminal chart"""
 
-    min_year = min(year_counts.keys())
-    max_year = max(year_counts.keys())
-    all_years = list(range(min_year, max_year + 1))
-    counts = [year_counts.get(year, 0) for year in all_years]
+    if not songs:
+        item("No songs to analyze")
+        return {}
 
-    item(f"{len(songs)} songs from {min_year} to {max_year}")
+    year_counts = get_year_counts(songs)
+    item(f"{len(songs)} songs from {min(year_counts)} to {max(year_counts)}")
 
-    # Generate PDF version with labels
     item("Creating PDF chart...")
-    plt.figure()
-    plt.bar(all_years, counts, color="black")
-    plt.ylabel("Songs per Year")
-    plt.xticks()
-
-    with PdfPages(output_pdf) as pdf:
-        pdf.savefig()
-        plt.close()
-
-    # Generate CLI PNG version (inverted, no labels)
-    item("Creating CLI chart...")
-    _, ax = plt.subplots(figsize=(12, 6))
-    ax.bar(all_years, counts, color="#1F456E")  # Dark blue for visibility on both light and dark backgrounds
-    ax.set_xticks([])
-    ax.set_yticks([])
-    ax.set_facecolor("none")
-    ax.spines["top"].set_visible(False)
-    ax.spines["right"].set_visible(False)
-    ax.spines["bottom"].set_visible(False)
-    ax.spines["left"].set_visible(False)
-
-    # Remove all padding and margins
-    plt.subplots_adjust(left=0, right=1, top=1, bottom=0)
-    plt.margins(0, 0)
-    ax.set_xlim(ax.get_xlim())
-    ax.set_ylim(ax.get_ylim())
-
-    plt.savefig(output_png, dpi=300, bbox_inches="tight", pad_inches=0, facecolor="none", transparent=True)
-    plt.close()
+    _compile(str(YEAR_DISTRIBUTION_TEMPLATE), output_pdf, {"years": json.dumps(list(year_counts.items()))})
+
+    return year_counts
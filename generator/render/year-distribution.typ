@@ -0,0 +1,61 @@
+// Bar chart of the number of songs per year.
+// The counts are passed as JSON list of [year, count] pairs in the "years" input, without gaps between the years.
+
+#let years = json(bytes(sys.inputs.years))
+#let max_count = calc.max(..years.map(((_, count)) => count))
+
+#let chart_width = 16cm
+#let chart_height = 10cm
+#let tick_length = 0.15cm
+#let axis_stroke = 0.5pt
+
+#let bar_width = chart_width / years.len()
+#let bar_height(count) = count / max_count * chart_height
+
+// steps of the axis labels, at most 6 on the y axis and at most 12 on the x axis
+#let count_step = calc.max(1, calc.ceil(max_count / 6))
+#let year_step = {
+  let step = (1, 2, 5, 10, 20, 50).find(step => years.len() / step <= 12)
+  if step == none { 100 } else { step }
+}
+
+#set page(width: auto, height: auto, margin: (left: 2.5cm, rest: 1.5cm))
+#set text(font: ("SF Pro Display", "sans-serif"), size: 9pt)
+
+#box(width: chart_width, height: chart_height, {
+  for (i, (_, count)) in years.enumerate() {
+    place(
+      bottom + left,
+      dx: (i + 0.1) * bar_width,
+      rect(width: 0.8 * bar_width, height: bar_height(count), fill: black),
+    )
+  }
+
+  // y axis with the song counts
+  place(top + left, line(start: (0pt, 0pt), end: (0pt, chart_height), stroke: axis_stroke))
+  for count in range(0, max_count + 1, step: count_step) {
+    let dy = -bar_height(count)
+    place(bottom + left, dx: -tick_length, dy: dy, line(length: tick_length, stroke: axis_stroke))
+    place(bottom + left, dx: -1.2cm, dy: dy + 0.5em, box(width: 1cm, align(right, str(count))))
+  }
+  place(
+    horizon + left,
+    dx: -2.2cm,
+    rotate(-90deg, reflow: true, [Songs per Year]),
+  )
+
+  // x axis with the years
+  place(bottom + left, line(length: chart_width, stroke: axis_stroke))
+  for (i, (year, _)) in years.enumerate() {
+    if calc.rem(year, year_step) == 0 {
+      let dx = (i + 0.5) * bar_width
+      place(
+        bottom + left,
+        dx: dx,
+        dy: tick_length,
+        line(start: (0pt, 0pt), end: (0pt, tick_length), stroke: axis_stroke),
+      )
+      place(bottom + left, dx: dx - 1cm, dy: tick_length + 1.2em, box(width: 2cm, align(center, str(year))))
+    }
+  }
+})
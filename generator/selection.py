@@ -0,0 +1,122 @@
+"""Selection of a deck of songs from a large playlist, balanced over the years and with few songs per artist."""
+
+import os
+from collections import Counter
+from dataclasses import dataclass
+from enum import StrEnum
+
+import numpy as np
+
+from generator.connectors import Song
+from generator.logger import item
+from generator.utils import get_env_var
+
+# fixed seed, the same playlist always results in the same deck
+SELECTION_SEED = 0
+
+
+class Distribution(StrEnum):
+    UNIFORM = "uniform"  # the same number of songs from every year bucket
+    PLAYLIST = "playlist"  # the year buckets keep their share of the playlist
+
+
+@dataclass(frozen=True)
+class SelectionConfig:
+    count: int
+    bucket_years: int = 10
+    distribution: Distribution = Distribution.UNIFORM
+    max_songs_per_artist: int = 2
+
+
+def get_selection_config() -> SelectionConfig | None:
+    """Get the configured deck selection, None if the whole playlist is used"""
+
+    if not os.getenv("DECK_SIZE"):
+        return None
+
+    count = int(get_env_var("DECK_SIZE"))
+    if count < 1:
+        raise ValueError(f"DECK_SIZE must be at least 1, got {count}")
+
+    return SelectionConfig(
+        count=count,
+        bucket_years=max(1, int(get_env_var("DECK_YEAR_BUCKET", "10"))),
+        distribution=Distribution(get_env_var("DECK_DISTRIBUTION", Distribution.UNIFORM)),
+        max_songs_per_artist=max(1, int(get_env_var("MAX_SONGS_PER_ARTIST", "2"))),
+    )
+
+
+def allocate_quotas(count: int, weights: np.ndarray, available: np.ndarray) -> np.ndarray:
+    """Split count into integer quotas proportional to the weights, without exceeding the available songs
+
+    The share of buckets with too few songs is redistributed to the others in proportion to their weights.
+    """
+
+    quotas = np.zeros_like(available)
+    remaining = min(count, int(available.sum()))
+    while remaining > 0:
+        shares = np.where(quotas < available, weights, 0.0)
+        shares = shares / shares.sum() * remaining
+        added = np.minimum(np.floor(shares).astype(available.dtype), available - quotas)
+        if not added.any():
+            # fewer songs left than open buckets, they go to the buckets with the largest shares
+            added[np.argsort(-shares, kind="stable")[:remaining]] = 1
+        quotas += added
+        remaining -= int(added.sum())
+    return quotas
+
+
+def select_songs(songs: list[Song], config: SelectionConfig) -> list[Song]:
+    """Pick config.count songs matching the target year distribution with at most max_songs_per_artist per artist
+
+    The songs are visited once in a random but fixed order and taken while their year bucket has quota left and none of
+    their artists reached the cap. Quota that can't be filled because of the artist cap is filled from other buckets.
+    """
+
+    if len(songs) <= config.count:
+        item(f"Playlist has {len(songs)} songs, no selection needed for a deck of {config.count}")
+        return songs
+
+    years = np.fromiter((song.year for song in songs), dtype=np.int64, count=len(songs))
+    buckets, song_buckets, available = np.unique(years // config.bucket_years, return_inverse=True, return_counts=True)
+
+    weights = np.ones(len(buckets)) if config.distribution == Distribution.UNIFORM else available.astype(float)
+    remaining = allocate_quotas(config.count, weights, available)
+    quotas = remaining.copy()
+
+    order = np.random.default_rng(SELECTION_SEED).permutation(len(songs))
+    artist_counts: Counter[str] = Counter()
+    selected: list[int] = []
+    skipped: list[int] = []
+
+    def fits_artist_cap(song: Song) -> bool:
+        return all(artist_counts[artist.lower()] < config.max_songs_per_artist for artist in song.artists)
+
+    def take(index: int) -> None:
+        selected.append(index)
+        artist_counts.update({artist.lower() for artist in songs[index].artists})
+
+    for index in order.tolist():
+        bucket = song_buckets[index]
+        if remaining[bucket] > 0 and fits_artist_cap(songs[index]):
+            remaining[bucket] -= 1
+            take(index)
+        else:
+            skipped.append(index)
+
+    for index in skipped:
+        if len(selected) >= config.count:
+            break
+        if fits_artist_cap(songs[index]):
+            take(index)
+
+    selected_counts = np.bincount(song_buckets[selected], minlength=len(buckets))
+    for bucket, quota, count, total in zip(buckets.tolist(), quotas, selected_counts, available, strict=True):
+        start_year = bucket * config.bucket_years
+        label = str(start_year) if config.bucket_years == 1 else f"{start_year}-{start_year + config.bucket_years - 1}"
+        item(f"{label}: {count} of {total} songs (target {quota})")
+
+    if len(selected) < config.count:
+        item(f"Only {len(selected)} songs fit the limit of {config.max_songs_per_artist} songs per artist")
+
+    return [songs[index] for index in sorted(selected)]
@@ -9,6 +9,13 @@ class Theme(StrEnum):
     SUMMER_BREEZE = "summer-breeze"
 
 
+# card_size of the Typst themes
+CARD_SIZE_CM = 6.0
+
+# rows * cols of the Typst themes, every page is followed by its back side
+CARDS_PER_PAGE = 12
+
+
 def get_card_colors(theme: Theme) -> list[tuple[int, int, int]]:
     """Get the RGB colors of the palette for the given theme"""
 
@@ -64,6 +71,21 @@ def get_qr_fill_color(theme: Theme) -> tuple[int, int, int]:
             return (255, 255, 255)
 
 
+def get_qr_print_size_cm(theme: Theme) -> float:
+    """Get the printed width of the QR codes, the card size without the inset of the theme"""
+
+    match theme:
+        case Theme.SUMMER_BREEZE:
+            return CARD_SIZE_CM - 2.0
+        case _:
+            return CARD_SIZE_CM - 1.0
+
+
+def get_decoration_print_height_cm(theme: Theme) -> float:  # noqa: ARG001
+    """Get the printed height of the decoration images on the back side of the cards"""
+    return 0.15 * CARD_SIZE_CM
+
+
 def get_image_paths(theme: Theme, purpose: str = "qr") -> list[Path]:
     """Get the paths of QR code images for the given theme"""
 
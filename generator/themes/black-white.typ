@@ -1,4 +1,5 @@
-#let songs = json("../../generated/songs.json")
+#import "lib/qr-code.typ": qr_code
+#import "lib/songs.typ": songs
 
 //this is a4
 #let page_width = 210mm
@@ -35,8 +36,8 @@
   square(
     size: card_size,
     inset: 0.5cm,
-    image(
-      "../../generated/qr-codes/" + song.id + ".png",
+    qr_code(
+      song,
       width: 100%
     )
   )
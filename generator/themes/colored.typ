@@ -1,4 +1,6 @@
-#let songs = json("../../generated/songs.json")
+#import "lib/qr-code.typ": qr_code
+#import "lib/shard.typ": shard_start
+#import "lib/songs.typ": songs
 
 //this is a4
 #let page_width = 210mm
@@ -42,23 +44,17 @@
 
 // Function to get color for a song based on its index
 #let get_card_color(song_index) = {
-  let palette_size = color_palette.len()
-  if song_index < palette_size {
-    color_palette.at(song_index)
-  } else {
-    get_card_color(song_index - palette_size)
-  }
+  color_palette.at(calc.rem(song_index, color_palette.len()))
 }
 
 #let qr_front_side(song, song_index) = {
-  let qr_code = image("../../generated/qr-codes/" + song.id + ".png", width: card_size - 1cm)
   square(
     size: card_size,
     fill: rgb(1, 0, 0),
     inset: 0.5cm,
     align(
       center,
-      qr_code
+      qr_code(song, width: card_size - 1cm)
     )
   )
 }
@@ -170,7 +166,7 @@
 
 #let get_pages(songs) = {
   let pages = ()
-  let global_song_index = 0
+  let global_song_index = shard_start
 
   //add test and qr codes
   for page in songs.chunks(rows*cols) {
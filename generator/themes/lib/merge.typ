@@ -0,0 +1,15 @@
+// Concatenates the pages of the compiled shards into the final document, keeping their order and page sizes.
+// The shards are passed as JSON list of {path, pages} in the "shards" input, paths are relative to the project root.
+
+#let shards = json(bytes(sys.inputs.shards))
+
+#set page(width: auto, height: auto, margin: 0pt)
+
+#for (i, shard) in shards.enumerate() {
+  for page_number in range(1, shard.pages + 1) {
+    if i != 0 or page_number != 1 {
+      pagebreak()
+    }
+    image(shard.path, page: page_number)
+  }
+}
@@ -0,0 +1,34 @@
+// QR code of a song, rendered as PNG or as SVG depending on the "qr-format" input.
+// SVG QR codes don't contain the embedded image, it is placed on top so the PDF only contains it once.
+
+#let qr_format = sys.inputs.at("qr-format", default: "png")
+// every deck of a batch build has its own QR codes, the path is relative to the project root
+#let qr_dir = sys.inputs.at("qr-dir", default: "/generated/qr-codes")
+
+#let embedded_images = if qr_format == "svg" {
+  json(qr_dir + "/embedded-images.json")
+} else {
+  (:)
+}
+
+#let qr_code(song, width: 100%) = {
+  if qr_format != "svg" {
+    image(qr_dir + "/" + song.id + ".png", width: width)
+  } else {
+    let embedded_image = embedded_images.at(song.id, default: none)
+    box(
+      width: width,
+      layout(size => {
+        image(qr_dir + "/" + song.id + ".svg", width: size.width)
+        if embedded_image != none {
+          place(
+            top + left,
+            dx: embedded_image.offset * size.width,
+            dy: embedded_image.offset * size.width,
+            image("../../../generated/images/" + embedded_image.image, width: embedded_image.size * size.width)
+          )
+        }
+      })
+    )
+  }
+}
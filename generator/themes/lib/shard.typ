@@ -0,0 +1,9 @@
+// Page aligned range of the songs compiled by this document.
+// Large decks are compiled in shards, the build passes the range of each shard as "shard-start" and "shard-end" inputs.
+
+#let shard_start = int(sys.inputs.at("shard-start", default: "0"))
+
+#let shard_songs(songs) = {
+  let shard_end = int(sys.inputs.at("shard-end", default: str(songs.len())))
+  songs.slice(calc.min(shard_start, songs.len()), calc.min(shard_end, songs.len()))
+}
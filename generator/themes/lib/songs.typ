@@ -0,0 +1,12 @@
+// Songs of the cards compiled by this document.
+// The build passes the songs in memory as "songs" input, without it they are read from generated/songs.json.
+
+#import "shard.typ": shard_songs
+
+#let songs = shard_songs(
+  if "songs" in sys.inputs {
+    json(bytes(sys.inputs.songs))
+  } else {
+    json("../../../generated/songs.json")
+  }
+)
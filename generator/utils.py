@@ -1,3 +1,4 @@
+import math
 import os
 
 
@@ -10,9 +11,49 @@ def get_env_var(key: str, default: str | None = None) -> str:
     return value
 
 
-def get_max_workers(min_workers=1) -> int:
-    """Get the maximum number of workers to use for parallel processing"""
-    return min(int(get_env_var("MAX_WORKERS", "8")), min_workers, os.cpu_count() or 1)
+def get_env_flag(key: str, default: bool = False) -> bool:
+    """Get an optional boolean environment variable, only "true" (case insensitive) enables it"""
+    value = os.getenv(key)
+    return value.lower() == "true" if value else default
+
+
+def get_max_workers(task_count: int | None = None) -> int:
+    """Get the number of worker processes for parallel processing
+
+    This is the MAX_WORKERS environment variable (default: number of CPUs), capped by the number of CPUs and, if given,
+    the number of tasks since more workers than tasks would idle.
+    """
+
+    cpu_count = os.cpu_count() or 1
+    max_workers = min(int(get_env_var("MAX_WORKERS", str(cpu_count))), cpu_count)
+    if task_count is not None:
+        max_workers = min(max_workers, task_count)
+    return max(1, max_workers)
+
+
+def get_fetch_workers() -> int:
+    """Get the number of concurrent requests to the music service APIs"""
+    return max(1, int(get_env_var("FETCH_WORKERS", "8")))
+
+
+def get_font_paths() -> list[str]:
+    """Get the additional font directories for Typst from FONT_PATHS, separated like PATH"""
+    return [path for path in os.getenv("FONT_PATHS", "").split(os.pathsep) if path]
+
+
+def get_typst_shard_cards() -> int:
+    """Get the minimum number of cards per Typst shard, smaller decks are compiled as a single document"""
+    return max(1, int(get_env_var("TYPST_SHARD_CARDS", "500")))
+
+
+def get_print_dpi() -> int:
+    """Get the resolution the cards are printed with, rasters are rendered to match it"""
+    return int(get_env_var("PRINT_DPI", "300"))
+
+
+def cm_to_pixels(size_cm: float, dpi: int) -> int:
+    """Convert a printed size to the number of pixels needed at the given resolution"""
+    return math.ceil(size_cm / 2.54 * dpi)
 
 
 def calculate_relative_luminance(rgb: tuple[int, int, int]) -> float:
@@ -0,0 +1,27 @@
+"""Polls files for changes, used to rebuild the cards while editing themes or overrides."""
+
+import time
+from collections.abc import Callable, Iterable, Iterator
+from pathlib import Path
+
+WATCH_INTERVAL = 0.5
+
+
+def _snapshot(paths: Iterable[Path]) -> dict[Path, int]:
+    return {path: path.stat().st_mtime_ns for path in paths if path.exists()}
+
+
+def watch_changes(paths: Callable[[], Iterable[Path]], interval: float = WATCH_INTERVAL) -> Iterator[set[Path]]:
+    """Yield the paths that were modified, created or deleted since the last check, forever
+
+    The paths are collected again for every check, so new files matching e.g. a glob are picked up.
+    """
+
+    previous = _snapshot(paths())
+    while True:
+        time.sleep(interval)
+        current = _snapshot(paths())
+        changed = {path for path in previous.keys() | current.keys() if previous.get(path) != current.get(path)}
+        previous = current
+        if changed:
+            yield changed
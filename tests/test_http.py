@@ -0,0 +1,193 @@
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+import requests
+import requests.adapters
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from generator.connectors.apple_music import AppleMusicConnector
+from generator.connectors.http import request_with_retries
+from generator.connectors.replay import (
+    Cassette,
+    Faults,
+    RecordingAdapter,
+    ReplayAdapter,
+    ReplayServer,
+    request_key,
+)
+
+URL = "https://api.example.com/v1/items"
+
+
+class ScriptedAdapter(requests.adapters.HTTPAdapter):
+    """Adapter answering the requests with the given status codes, headers and bodies in order, the last one repeated"""
+
+    def __init__(self, responses: list[tuple]):
+        super().__init__()
+        self.responses = responses
+        self.requests: list[requests.PreparedRequest] = []
+
+    def send(self, request: requests.PreparedRequest, **_) -> requests.Response:
+        status, headers, *body = self.responses[min(len(self.requests), len(self.responses) - 1)]
+        self.requests.append(request)
+
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update({"Content-Type": "application/json", **headers})
+        response._content = json.dumps(body[0] if body else {"data": [], "meta": {"total": 0}}).encode("utf-8")
+        response.url = request.url
+        response.request = request
+        return response
+
+
+def scripted_session(*responses: tuple) -> tuple[requests.Session, ScriptedAdapter]:
+    session = requests.Session()
+    adapter = ScriptedAdapter(list(responses))
+    session.mount("https://", adapter)
+    return session, adapter
+
+
+@pytest.fixture
+def sleeps(monkeypatch: pytest.MonkeyPatch) -> list[float]:
+    sleeps: list[float] = []
+    monkeypatch.setattr(time, "sleep", sleeps.append)
+    return sleeps
+
+
+def test_rate_limit_waits_for_retry_after(sleeps: list[float]):
+    session, adapter = scripted_session((429, {"Retry-After": "3"}), (200, {}))
+
+    response = request_with_retries(session, "GET", URL)
+
+    assert response.status_code == 200
+    assert len(adapter.requests) == 2
+    assert sleeps == [pytest.approx(3, rel=0.1)]
+
+
+def test_retry_after_zero_is_respected(sleeps: list[float]):
+    session, _ = scripted_session((429, {"Retry-After": "0"}), (200, {}))
+
+    request_with_retries(session, "GET", URL, backoff=5)
+
+    assert sleeps == [0]
+
+
+def test_server_errors_back_off_exponentially(sleeps: list[float]):
+    session, adapter = scripted_session((503, {}), (503, {}), (503, {}), (200, {}))
+
+    response = request_with_retries(session, "GET", URL, backoff=1)
+
+    assert response.status_code == 200
+    assert len(adapter.requests) == 4
+    assert sleeps == [pytest.approx(1, rel=0.1), pytest.approx(2, rel=0.1), pytest.approx(4, rel=0.1)]
+
+
+def test_gives_up_after_max_retries(sleeps: list[float]):
+    session, adapter = scripted_session((503, {}))
+
+    with pytest.raises(requests.exceptions.HTTPError) as error:
+        request_with_retries(session, "GET", URL, max_retries=2)
+
+    assert error.value.response.status_code == 503
+    assert len(adapter.requests) == 3
+    assert len(sleeps) == 2
+
+
+def test_client_errors_are_not_retried(sleeps: list[float]):
+    session, adapter = scripted_session((404, {}))
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        request_with_retries(session, "GET", URL)
+
+    assert len(adapter.requests) == 1
+    assert sleeps == []
+
+
+def test_gives_up_on_a_rate_limited_stand_in_server(tmp_path: Path, sleeps: list[float]):
+    cassette = Cassette(tmp_path / "cassette.json")
+    cassette.interactions[request_key("GET", "api.example.com", "/v1/items", "")] = {
+        "status": 200,
+        "content_type": "application/json",
+        "body": "{}",
+    }
+    server = ReplayServer(cassette, Faults(rate_limit_rate=1.0, retry_after=2))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    session = requests.Session()
+    session.mount("https://", ReplayAdapter(server))
+    try:
+        with pytest.raises(requests.exceptions.HTTPError) as error:
+            request_with_retries(session, "GET", URL, max_retries=3)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert error.value.response.status_code == 429
+    assert sleeps == [pytest.approx(2, rel=0.1)] * 3
+
+
+def test_only_successful_responses_are_recorded(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    scripted = ScriptedAdapter([(200, {}, {"data": ["recorded"]}), (401, {}, {"error": "unauthorized"})])
+    monkeypatch.setattr(requests.adapters.HTTPAdapter, "send", lambda _, request, **__: scripted.send(request))
+    cassette = Cassette(tmp_path / "cassette.json")
+
+    session = requests.Session()
+    session.mount("https://", RecordingAdapter(cassette))
+    session.get(URL)
+    session.get(URL)
+
+    (interaction,) = cassette.interactions.values()
+    assert interaction["status"] == 200
+    assert json.loads(interaction["body"]) == {"data": ["recorded"]}
+
+
+@pytest.fixture
+def apple_music(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> AppleMusicConnector:
+    private_key = ec.generate_private_key(ec.SECP256R1()).private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    key_path = tmp_path / "AuthKey.p8"
+    key_path.write_bytes(private_key)
+
+    monkeypatch.setenv("APPLE_TEAM_ID", "team")
+    monkeypatch.setenv("APPLE_KEY_ID", "key")
+    monkeypatch.setenv("APPLE_PRIVATE_KEY_PATH", str(key_path))
+    monkeypatch.delenv("APPLE_MUSIC_API_BASE_URL", raising=False)
+    monkeypatch.delenv("APPLE_MUSIC_USER_TOKEN", raising=False)
+    monkeypatch.setenv("HTTP_MODE", "live")
+    return AppleMusicConnector()
+
+
+def test_rejected_token_is_refreshed_once(apple_music: AppleMusicConnector):
+    session, adapter = scripted_session((401, {}), (200, {}))
+    apple_music._session = session
+
+    issued_tokens = iter(["first", "second"])
+    apple_music._generate_token = lambda: (next(issued_tokens), time.time() + AppleMusicConnector._TOKEN_LIFETIME)
+
+    assert apple_music._make_request("/v1/catalog/us/playlists/p") == {"data": [], "meta": {"total": 0}}
+    assert [request.headers["Authorization"] for request in adapter.requests] == ["Bearer first", "Bearer second"]
+
+
+def test_token_is_refreshed_only_once(apple_music: AppleMusicConnector):
+    session, adapter = scripted_session((401, {}))
+    apple_music._session = session
+
+    with pytest.raises(requests.exceptions.HTTPError):
+        apple_music._make_request("/v1/catalog/us/playlists/p")
+
+    assert len(adapter.requests) == 2
+
+
+def test_next_pages_are_requested_from_the_base_url(apple_music: AppleMusicConnector):
+    next_link = "https://api.music.apple.com/v1/catalog/us/playlists/p/tracks?offset=100"
+    session, adapter = scripted_session((200, {}, {"data": [], "next": next_link}), (200, {}, {"data": []}))
+    apple_music._session = session
+    apple_music._base_url = "https://stand-in.example.com"
+
+    assert len(list(apple_music._iter_playlist_pages("p"))) == 2
+    assert adapter.requests[1].url == "https://stand-in.example.com/v1/catalog/us/playlists/p/tracks?offset=100"
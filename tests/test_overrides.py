@@ -0,0 +1,87 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from generator.connectors import Song
+from generator.connectors.interfaces import Source
+from generator.overrides import OverrideStore
+
+
+def make_song(song_id: str, title: str = "Song", artist: str = "Artist") -> Song:
+    return Song(
+        id=song_id,
+        title=title,
+        artists=[artist],
+        year=2000,
+        url=f"https://open.spotify.com/track/{song_id}",
+        source=Source.SPOTIFY,
+    )
+
+
+@pytest.fixture
+def store(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> OverrideStore:
+    monkeypatch.chdir(tmp_path)
+    with OverrideStore(tmp_path / "overrides.db") as store:
+        yield store
+
+
+def write_overrides(path: Path, overrides: list[dict]) -> Path:
+    path.write_text(json.dumps(overrides), encoding="utf-8")
+    return path
+
+
+def test_unknown_fields_are_ignored(store: OverrideStore, tmp_path: Path):
+    overrides_json = write_overrides(
+        tmp_path / "overrides.json", [{"id": "a", "year": 1970, "note": "typo on Spotify"}]
+    )
+
+    store.import_json(overrides_json)
+    (song,) = store.apply([make_song("a")])
+
+    assert song.year == 1970
+    # kept for the export
+    store.export_json(tmp_path / "exported.json")
+    assert json.loads((tmp_path / "exported.json").read_text(encoding="utf-8"))[0]["note"] == "typo on Spotify"
+
+
+def test_override_matches_re_release_by_its_title_and_artist(store: OverrideStore, tmp_path: Path):
+    overrides_json = write_overrides(
+        tmp_path / "overrides.json",
+        [{"id": "a", "title": "Don't Stop", "artists": ["Band"], "year": 1970, "url": "https://example.com/a"}],
+    )
+
+    store.import_json(overrides_json)
+    (song,) = store.apply([make_song("b", "Dont Stop - Remastered 2011", "Band")])
+
+    assert song.year == 1970
+    # the URL belongs to the song of the override's ID
+    assert song.url == "https://open.spotify.com/track/b"
+
+
+@pytest.mark.parametrize("previous_build", [False, True])
+def test_override_without_title_learns_it_from_its_song(store: OverrideStore, tmp_path: Path, previous_build: bool):
+    if previous_build:
+        # the songs of a previous build don't change which songs an override matches
+        (tmp_path / "generated").mkdir()
+        (tmp_path / "generated" / "songs.json").write_text(
+            json.dumps([{"id": "a", "title": "Song", "artists": ["Artist"], "year": 2000}]), encoding="utf-8"
+        )
+    store.import_json(write_overrides(tmp_path / "overrides.json", [{"id": "a", "year": 1970}]))
+
+    assert store.find([make_song("b")]) == [None]
+    assert store.find([make_song("a")]) == [{"year": 1970}]
+    assert store.find([make_song("b")]) == [{"year": 1970}]
+
+
+def test_overrides_removed_from_the_file_are_removed(store: OverrideStore, tmp_path: Path):
+    overrides_json = write_overrides(
+        tmp_path / "overrides.json", [{"id": "a", "year": 1970}, {"id": "b", "year": 1980}]
+    )
+    corrections_json = write_overrides(tmp_path / "corrections.json", [{"id": "c", "year": 1990}])
+    store.import_json(overrides_json)
+    store.import_json(corrections_json)
+
+    store.import_json(write_overrides(overrides_json, [{"id": "b", "year": 1981}]))
+
+    assert store.find([make_song("a"), make_song("b"), make_song("c")]) == [None, {"year": 1981}, {"year": 1990}]
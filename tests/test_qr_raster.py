@@ -0,0 +1,73 @@
+from pathlib import Path
+
+import numpy as np
+import pytest
+from PIL import Image
+from qrcode.image.styles.colormasks import SolidFillColorMask
+from qrcode.image.styles.moduledrawers.pil import CircleModuleDrawer
+
+from generator.render.qr import QR_EMBEDDED_IMAGE_RATIO, _new_qr_code
+from generator.render.qr_raster import render_qr_code
+from generator.render.qr_vector import render_qr_code_svg
+
+COLORS = [
+    ((255, 255, 255), (0, 0, 0)),
+    ((250, 240, 220), (120, 30, 60)),
+]
+
+
+@pytest.fixture
+def embedded_image(tmp_path: Path) -> Path:
+    """Semi-transparent RGBA image, so the alpha compositing is compared as well"""
+
+    path = tmp_path / "embedded.png"
+    gradient = np.zeros((64, 64, 4), dtype=np.uint8)
+    gradient[..., 0] = np.arange(64)[:, None] * 4
+    gradient[..., 2] = np.arange(64)[None, :] * 4
+    gradient[..., 3] = 128
+    Image.fromarray(gradient, "RGBA").save(path)
+    return path
+
+
+@pytest.mark.parametrize("box_size", [3, 12])
+@pytest.mark.parametrize(("back_color", "front_color"), COLORS)
+@pytest.mark.parametrize("with_image", [False, True])
+def test_numpy_renderer_matches_styled_pil_image(box_size, back_color, front_color, with_image, embedded_image):
+    qr = _new_qr_code()
+    qr.add_data("https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC")
+    qr.make(fit=True)
+    qr.box_size = box_size
+    image_path = embedded_image if with_image else None
+
+    styled = qr.make_image(
+        embeded_image=Image.open(image_path) if image_path else None,
+        embeded_image_ratio=QR_EMBEDDED_IMAGE_RATIO,
+        module_drawer=CircleModuleDrawer(),
+        color_mask=SolidFillColorMask(back_color=back_color, front_color=front_color),
+    ).get_image()
+    rendered = render_qr_code(
+        qr.get_matrix(),
+        box_size=box_size,
+        back_color=back_color,
+        front_color=front_color,
+        embedded_image_path=image_path,
+        embedded_image_ratio=QR_EMBEDDED_IMAGE_RATIO,
+    )
+
+    assert rendered.mode == styled.mode
+    assert rendered.tobytes() == styled.tobytes()
+
+
+def test_svg_draws_eyes_as_squares():
+    qr = _new_qr_code()
+    qr.add_data("https://open.spotify.com/track/4uLU6hMCjMI75M1A2tKUQC")
+    qr.make(fit=True)
+    modules = qr.get_matrix()
+    size = len(modules)
+
+    svg = render_qr_code_svg(modules, back_color=(255, 255, 255), front_color=(0, 0, 0))
+
+    # corners of the three finder patterns
+    for x, y in [(0, 0), (size - 1, 0), (0, size - 1)]:
+        assert f"M{x} {y}h1v1h-1z" in svg
+    assert f"M{size - 1} {size - 1}h1v1h-1z" not in svg
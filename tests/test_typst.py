@@ -0,0 +1,46 @@
+import re
+import shutil
+from pathlib import Path
+
+import pytest
+
+from generator.render import typst
+from generator.render.executor import RenderExecutor
+from generator.themes import CARDS_PER_PAGE
+
+# front and back side of every page of cards
+SHARD_TEMPLATE = """
+#set page(width: 2cm, height: 2cm)
+#let cards = int(sys.inputs.at("shard-end")) - int(sys.inputs.at("shard-start"))
+#for page in range(calc.ceil(cards / int(sys.inputs.cards-per-page)) * 2) {
+  if page != 0 { pagebreak() }
+  [#page]
+}
+"""
+
+
+@pytest.fixture
+def project_dir(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    """Project root with the merge template, as Typst only reads files below it"""
+
+    merge_template = tmp_path / typst.MERGE_TEMPLATE
+    merge_template.parent.mkdir(parents=True)
+    shutil.copyfile(typst.MERGE_TEMPLATE, merge_template)
+    (tmp_path / "shard.typ").write_text(SHARD_TEMPLATE, encoding="utf-8")
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+def test_sharded_compile_after_compiling_in_parent(project_dir: Path, monkeypatch: pytest.MonkeyPatch):
+    """Typst's thread pool doesn't survive a fork, so workers forked after a compile in the parent would hang"""
+
+    monkeypatch.setenv("TYPST_SHARD_CARDS", str(CARDS_PER_PAGE))
+    sys_inputs = {"cards-per-page": str(CARDS_PER_PAGE)}
+    shard_ranges = typst.get_shard_ranges(4 * CARDS_PER_PAGE, workers=2)
+    assert len(shard_ranges) == 2
+
+    typst._compile("shard.typ", "single.pdf", {**sys_inputs, "shard-start": "0", "shard-end": "1"})
+    with RenderExecutor(max_workers=2) as executor:
+        typst._compile_sharded(Path("shard.typ"), sys_inputs, shard_ranges, "cards.pdf", executor)
+
+    assert len(re.findall(rb"/Type\s*/Page\b", (project_dir / "cards.pdf").read_bytes())) == 8